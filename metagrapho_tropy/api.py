@@ -3,8 +3,213 @@
 TranskribusProcessingAPI class.
 """
 
+from __future__ import annotations
+import base64
+import email.utils
+import json
 import logging
+import math
+import mmap
+import os.path
+import threading
+import time
 import requests
+from metagrapho_tropy.metrics import Metrics
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class Base64FileBody:
+    """ File-like JSON request body which base64-encodes an image file chunk by chunk while it is read.
+
+    Peak memory stays bounded by the chunk size regardless of the size of the image file. The time spent reading and
+    encoding the image is accumulated in read_seconds and encode_seconds. An image already in memory (e.g. loaded by
+    the Prefetcher) is encoded from data instead of being read from file.
+
+    :param prefix: the JSON body up to the Base64 string
+    :param file_path: complete path to the image file
+    :param suffix: the JSON body after the Base64 string
+    :param chunk_size: number of image bytes encoded at once (rounded down to a multiple of 3), defaults to 196608
+    :param data: the content of the image file, defaults to None (= read from file_path)
+    """
+
+    def __init__(self,
+                 prefix: bytes,
+                 file_path: str,
+                 suffix: bytes,
+                 chunk_size: int = 3 * 65536,
+                 data: bytes | mmap.mmap = None) -> None:
+        self.prefix = prefix
+        self.file_path = file_path
+        self.suffix = suffix
+        self.chunk_size = max(3, chunk_size - chunk_size % 3)
+        self.data = data
+        size = os.path.getsize(file_path) if data is None else len(data)
+        self.length = len(prefix) + 4 * -(-size // 3) + len(suffix)
+        self.read_seconds = 0.0
+        self.encode_seconds = 0.0
+        self._chunks = None
+        self._buffer = b""
+        self._position = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _generate(self):
+        """ Yield prefix, encoded image chunks and suffix. """
+
+        yield self.prefix
+        if self.data is not None:
+            view = memoryview(self.data)
+            try:
+                for offset in range(0, len(view), self.chunk_size):
+                    start = time.perf_counter()
+                    encoded = base64.b64encode(view[offset:offset + self.chunk_size])
+                    self.encode_seconds += time.perf_counter() - start
+                    yield encoded
+            finally:
+                view.release()
+            yield self.suffix
+            return
+        with open(self.file_path, "rb") as file:
+            while True:
+                start = time.perf_counter()
+                chunk = file.read(self.chunk_size)
+                self.read_seconds += time.perf_counter() - start
+                if not chunk:
+                    break
+                start = time.perf_counter()
+                encoded = base64.b64encode(chunk)
+                self.encode_seconds += time.perf_counter() - start
+                yield encoded
+        yield self.suffix
+
+    def read(self,
+             size: int = -1) -> bytes:
+        """ Read at most size bytes of the body (all remaining bytes if size is negative).
+
+        :param size: number of bytes, defaults to -1
+        """
+
+        if self._chunks is None:
+            self._chunks = self._generate()
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._position += len(data)
+
+        return data
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self,
+             offset: int,
+             whence: int = 0) -> int:
+        """ Rewind the body, only seeking to the start is supported (used when a request is retried). """
+
+        if offset != 0 or whence != 0:
+            raise OSError("Base64FileBody can only be rewound to the start.")
+        self.close()
+        self._position = 0
+
+        return 0
+
+    def close(self) -> None:
+        if self._chunks is not None:
+            self._chunks.close()
+        self._chunks = None
+        self._buffer = b""
+
+
+class RateLimiter:
+    """ Adaptive token-bucket limiter of requests.
+
+    Tokens are refilled at the current rate up to the burst size and every request takes one token. The rate is
+    halved on HTTP 429 and 5xx and increased by a fixed step after every successful request, up to max_rate. A
+    Retry-After header pauses all requests until the time given by the server.
+
+    :param max_rate: maximum number of requests per second, defaults to 10.0
+    :param burst: maximum number of requests sent at once, defaults to None (= max_rate rounded up)
+    :param min_rate: minimum number of requests per second, defaults to 0.5
+    :param increase: rate increase in requests per second after a successful request, defaults to 0.1
+    :param decrease: factor of the rate after a throttled or failed request, defaults to 0.5
+    """
+
+    def __init__(self,
+                 max_rate: float = 10.0,
+                 burst: int = None,
+                 min_rate: float = 0.5,
+                 increase: float = 0.1,
+                 decrease: float = 0.5) -> None:
+        self.max_rate = max_rate
+        self.burst = burst if burst is not None else max(1, math.ceil(max_rate))
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.rate = max_rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_retry_after(value: str | None) -> float | None:
+        """ Get the delay in seconds of a Retry-After header, either in seconds or an HTTP date (None if invalid).
+
+        :param value: the header value
+        """
+
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def acquire(self) -> None:
+        """ Wait for a token. """
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait_time)
+
+    def update(self,
+               status_code: int,
+               retry_after: str = None) -> None:
+        """ Adapt the rate to the status code and Retry-After header of a response.
+
+        :param status_code: the HTTP status code
+        :param retry_after: the Retry-After header, defaults to None
+        """
+
+        with self._lock:
+            if status_code == 429 or status_code >= 500:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                delay = self.parse_retry_after(retry_after)
+                if delay is not None:
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    self._tokens = 0.0
+                logging.warning(f"HTTP {status_code}, request rate decreased to {self.rate:.2f}/s"
+                                + ("." if delay is None else f", paused for {delay:.1f}s."))
+            elif status_code < 400:
+                self.rate = min(self.max_rate, self.rate + self.increase)
 
 
 class TranskribusProcessingAPI:
@@ -12,39 +217,177 @@ class TranskribusProcessingAPI:
 
     Swagger documentation of the API at https://transkribus.eu/processing/swagger/.
 
+    All requests share a pooled keep-alive session which retries on connection errors and an adaptive rate limiter
+    (see the RateLimiter class) which sees every response and retries on HTTP 429 and 5xx. The user is authenticated with the first request, not on
+    initialization, and the access token is refreshed transparently shortly before it expires.
+
     :param user: Transkribus username
     :param password: Transkribus password
+    :param pool_size: maximum number of pooled connections, defaults to 10
+    :param max_retries: maximum number of retries on connection errors, HTTP 429 and 5xx, defaults to 3
+    :param token_margin: time in seconds before expiry at which the access token is refreshed, defaults to 60
+    :param requests_per_second: maximum request rate of the rate limiter, defaults to 10.0
+    :param base_url: base URL of the API, defaults to None (= https://transkribus.eu/processing/v1)
+    :param token_url: URL of the token endpoint, defaults to None (= TranskribusProcessingAPI.token_url)
+    :param metrics: metrics of responses, uploads and bytes sent, defaults to None
     """
 
+    token_url = "https://account.readcoop.eu/auth/realms/readcoop/protocol/openid-connect/token"
+
     def __init__(self,
                  user: str,
-                 password: str) -> None:
+                 password: str,
+                 pool_size: int = 10,
+                 max_retries: int = 3,
+                 token_margin: float = 60,
+                 requests_per_second: float = 10.0,
+                 base_url: str = None,
+                 token_url: str = None,
+                 metrics: Metrics = None) -> None:
         self.user = user
         self.password = password
-        self.base_url = "https://transkribus.eu/processing/v1"
+        self.base_url = "https://transkribus.eu/processing/v1" if base_url is None else base_url
+        if token_url is not None:
+            self.token_url = token_url
+        self.token_margin = token_margin
+        self.max_retries = max_retries
+        self.limiter = RateLimiter(max_rate=requests_per_second)
+        self.metrics = metrics
+        self.access_token = None
         self.refresh_token = None
-        self.setup()
+        self.expires_at = None
+        self._token_lock = threading.Lock()
+        self.session = self.create_session(pool_size=pool_size,
+                                           max_retries=max_retries)
+
+    @staticmethod
+    def create_session(pool_size: int = 10,
+                       max_retries: int = 3) -> requests.Session:
+        """ Create a pooled keep-alive session with retries on connection errors (HTTP 429 and 5xx are left to the
+        rate limiter, see TranskribusProcessingAPI._request).
+
+        :param pool_size: maximum number of pooled connections, defaults to 10
+        :param max_retries: maximum number of retries, defaults to 3
+        """
+
+        retry = Retry(total=max_retries,
+                      connect=max_retries,
+                      read=0,
+                      status=0,
+                      backoff_factor=0.5)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        return session
 
     def setup(self):
         try:
             response = self.authenticate(user=self.user,
-                                         password=self.password)
+                                         password=self.password,
+                                         session=self.session,
+                                         token_url=self.token_url)
             if response.status_code != 200:
                 print(f"{response.json()}")
                 raise ConnectionError
-            self.refresh_token = response.json()["access_token"]
+            self._store_token(response.json())
             logging.info(f"{self.user} authorized successfully with {self.base_url}.")
         except ImportError:
             logging.exception(f"Could not authorize {self.user} with {self.base_url}!")
             raise
 
-    @staticmethod
-    def authenticate(user: str,
-                     password: str) -> requests.Response:
+    def _store_token(self,
+                     token: dict) -> None:
+        """ Store access token, refresh token and expiry time of a token endpoint response.
+
+        :param token: the token endpoint's JSON response
+        """
+
+        self.access_token = token["access_token"]
+        self.refresh_token = token.get("refresh_token")
+        self.expires_at = time.monotonic() + token.get("expires_in", 300)
+
+    def _refresh(self) -> None:
+        """ Refresh the access token with the refresh token or, if that fails, with username and password. """
+
+        response = None
+        if self.refresh_token is not None:
+            response = self.session.post(self.token_url,
+                                         data={"grant_type": "refresh_token",
+                                               "refresh_token": self.refresh_token,
+                                               "client_id": "processing-api-client"})
+        if response is None or response.status_code != 200:
+            logging.info(f"Re-authorizing {self.user} with {self.base_url}.")
+            self.setup()
+        else:
+            self._store_token(response.json())
+            logging.info(f"Access token of {self.user} refreshed.")
+
+    def _get_token(self,
+                   force: bool = False) -> str:
+        """ Get a valid access token, refreshing it if it is about to expire.
+
+        :param force: refresh the access token regardless of its expiry time, defaults to False
+        """
+
+        with self._token_lock:
+            if force or self.expires_at is None or time.monotonic() > self.expires_at - self.token_margin:
+                self._refresh()
+
+            return self.access_token
+
+    def _request(self,
+                 method: str,
+                 url: str,
+                 headers: dict,
+                 **kwargs) -> requests.Response:
+        """ Send an authorized and rate-limited request on the pooled session, retrying once with a new token on HTTP
+        401 and up to max_retries times on HTTP 429 and 5xx. Every attempt takes a token of the rate limiter and
+        adapts its rate.
+
+        :param method: the HTTP method
+        :param url: the URL
+        :param headers: the HTTP headers without authorization
+        :param kwargs: further arguments of requests.Session.request
+        """
+
+        refresh, refreshed, attempts = False, False, 0
+        while True:
+            token = self._get_token(force=refresh)
+            self.limiter.acquire()
+            response = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {token}"},
+                                            **kwargs)
+            self.limiter.update(status_code=response.status_code,
+                                retry_after=response.headers.get("Retry-After"))
+            if self.metrics is not None:
+                self.metrics.increment(f"http_{response.status_code}_responses")
+            refresh = response.status_code == 401 and not refreshed
+            if refresh:
+                refreshed = True
+            elif (response.status_code == 429 or response.status_code >= 500) and attempts < self.max_retries:
+                attempts += 1
+                logging.info(f"Retrying {method} {url} after HTTP {response.status_code} "
+                             f"({attempts}/{self.max_retries}).")
+            else:
+                return response
+            if hasattr(kwargs.get("data"), "seek"):
+                kwargs["data"].seek(0)
+
+    @classmethod
+    def authenticate(cls,
+                     user: str,
+                     password: str,
+                     session: requests.Session = None,
+                     token_url: str = None) -> requests.Response:
         """ Wrapper of oAuth2AuthCode.
 
         :param user: the username
         :param password: the password
+        :param session: the session used for the request, defaults to None
+        :param token_url: URL of the token endpoint, defaults to None (= TranskribusProcessingAPI.token_url)
         """
 
         data = {
@@ -54,29 +397,22 @@ class TranskribusProcessingAPI:
             "client_id": "processing-api-client",
         }
 
-        response = requests.post("https://account.readcoop.eu/auth/realms/readcoop/protocol/openid-connect/token",
-                                 data=data)
+        response = (session or requests).post(cls.token_url if token_url is None else token_url,
+                                              data=data)
 
         return response
 
-    def post_processes(self,
-                       line_model_id: int,
-                       atr_model_id: int,
-                       image: str
-                       ) -> requests.Response:
-        """ Wrapper of https://transkribus.eu/processing/swagger/#/Submit%20data%20for%20processing.
+    @staticmethod
+    def _process_data(line_model_id: int,
+                      atr_model_id: int,
+                      image: str) -> dict:
+        """ Get the request body of https://transkribus.eu/processing/swagger/#/Submit%20data%20for%20processing.
 
         :param line_model_id: the Transkribus layout detection model ID
         :param atr_model_id: the Transkribus ATR model ID
         :param image: an image encoded to Base64
         """
 
-        headers = {
-            "accept": "application/json",
-            "Authorization": f"Bearer {self.refresh_token}",
-            "Content-Type": "application/json",
-        }
-
         data = {
             "config": {
                 "lineDetection": {
@@ -92,12 +428,84 @@ class TranskribusProcessingAPI:
 
         }
 
-        response = requests.post(f"{self.base_url}/processes",
+        return data
+
+    def post_processes(self,
+                       line_model_id: int,
+                       atr_model_id: int,
+                       image: str
+                       ) -> requests.Response:
+        """ Wrapper of https://transkribus.eu/processing/swagger/#/Submit%20data%20for%20processing.
+
+        :param line_model_id: the Transkribus layout detection model ID
+        :param atr_model_id: the Transkribus ATR model ID
+        :param image: an image encoded to Base64
+        """
+
+        headers = {
+            "accept": "application/json",
+            "Content-Type": "application/json",
+        }
+
+        data = self._process_data(line_model_id=line_model_id,
+                                  atr_model_id=atr_model_id,
+                                  image=image)
+
+        response = self._request("POST",
+                                 f"{self.base_url}/processes",
                                  headers=headers,
                                  json=data)
 
         return response
 
+    def post_processes_from_file(self,
+                                 line_model_id: int,
+                                 atr_model_id: int,
+                                 image_path: str,
+                                 data: bytes | mmap.mmap = None
+                                 ) -> requests.Response:
+        """ Wrapper of https://transkribus.eu/processing/swagger/#/Submit%20data%20for%20processing streaming an
+        image file.
+
+        The image is base64-encoded chunk by chunk straight into the request body (see Base64FileBody) instead of
+        being loaded, encoded and serialized as a whole.
+
+        :param line_model_id: the Transkribus layout detection model ID
+        :param atr_model_id: the Transkribus ATR model ID
+        :param image_path: complete path to the image file
+        :param data: the content of the image file if it is loaded already, defaults to None
+        """
+
+        headers = {
+            "accept": "application/json",
+            "Content-Type": "application/json",
+        }
+
+        placeholder = "metagrapho_tropy_image"
+        prefix, suffix = json.dumps(self._process_data(line_model_id=line_model_id,
+                                                       atr_model_id=atr_model_id,
+                                                       image=placeholder)).split(f'"{placeholder}"')
+        body = Base64FileBody(prefix=f'{prefix}"'.encode("utf-8"),
+                              file_path=image_path,
+                              suffix=f'"{suffix}'.encode("utf-8"),
+                              data=data)
+
+        start = time.perf_counter()
+        try:
+            response = self._request("POST",
+                                     f"{self.base_url}/processes",
+                                     headers=headers,
+                                     data=body)
+        finally:
+            body.close()
+        if self.metrics is not None:
+            self.metrics.observe("upload_seconds", time.perf_counter() - start)
+            self.metrics.observe("file_read_seconds", body.read_seconds)
+            self.metrics.observe("encode_seconds", body.encode_seconds)
+            self.metrics.increment("bytes_out", len(body))
+
+        return response
+
     def get_result(self,
                    process_id: int):
         """ Wrapper of https://transkribus.eu/processing/swagger/#/Retrieve%20processing%20status%20and%20result.
@@ -107,11 +515,11 @@ class TranskribusProcessingAPI:
 
         headers = {
             "accept": "application/json",
-            "Authorization": f"Bearer {self.refresh_token}",
         }
 
-        response = requests.get(f"{self.base_url}/processes/{process_id}",
-                                headers=headers)
+        response = self._request("GET",
+                                 f"{self.base_url}/processes/{process_id}",
+                                 headers=headers)
 
         return response
 
@@ -120,10 +528,27 @@ class TranskribusProcessingAPI:
 
         headers = {
             "accept": "application/json",
-            "Authorization": f"Bearer {self.refresh_token}",
         }
 
-        response = requests.get(f"{self.base_url}/user",
-                                headers=headers)
+        response = self._request("GET",
+                                 f"{self.base_url}/user",
+                                 headers=headers)
 
         return response
+
+    def get_credits(self) -> float | None:
+        """ Get the user's remaining credits from https://transkribus.eu/processing/swagger/#/User%20Account/getUserInfo
+        (None if they cannot be determined). """
+
+        try:
+            response = self.get_user()
+            if response.status_code != 200:
+                logging.warning(f"Could not get user info of {self.user} (HTTP {response.status_code}).")
+                return None
+            remaining = response.json().get("credits")
+            if isinstance(remaining, dict):
+                remaining = remaining.get("balance", remaining.get("remaining"))
+            return None if remaining is None else float(remaining)
+        except (ValueError, TypeError, AttributeError):
+            logging.warning(f"Could not determine the remaining credits of {self.user}.")
+            return None
@@ -0,0 +1,174 @@
+""" cache.py
+=============
+Cache class. """
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+class Cache:
+    """ Persistent SQLite cache of Transkribus Processing API submissions.
+
+    Submissions are keyed by the SHA-256 hash of the image content together with the line and ATR model IDs, so that
+    duplicate images are only submitted once. Downloaded results are cached by process ID. Entries are evicted when
+    they are older than max_age or when there are more than max_entries (least recently used first).
+
+    :param file_path: complete path to the SQLite file including file extension, defaults to
+        'metagrapho_tropy_cache.sqlite'
+    :param max_entries: maximum number of entries, defaults to 100000
+    :param max_age: maximum age of an entry in seconds, defaults to 86400 (= 24 hours, the retention time of
+        processing results)
+    """
+
+    def __init__(self,
+                 file_path: str = "metagrapho_tropy_cache.sqlite",
+                 max_entries: int = 100000,
+                 max_age: float = 86400) -> None:
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS entries ("
+                                     "key TEXT PRIMARY KEY, "
+                                     "process_id TEXT, "
+                                     "scale REAL, "
+                                     "result TEXT, "
+                                     "created REAL, "
+                                     "accessed REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entries_process_id ON entries (process_id)")
+        self.evict()
+
+    @staticmethod
+    def hash_file(file_path: str,
+                  chunk_size: int = 1048576) -> str:
+        """ Get the SHA-256 hash of a file's content.
+
+        :param file_path: complete path to file including filename and extension
+        :param chunk_size: number of bytes hashed at once, defaults to 1048576
+        """
+
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_data(data: bytes) -> str:
+        """ Get the SHA-256 hash of a file's content already in memory.
+
+        :param data: the content
+        """
+
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def key(content_hash: str,
+            line_model_id: int,
+            atr_model_id: int) -> str:
+        """ Get the cache key of a submission.
+
+        :param content_hash: the SHA-256 hash of the image content
+        :param line_model_id: the Transkribus line model ID
+        :param atr_model_id: the Transkribus ATR model ID
+        """
+
+        return f"{content_hash}:{line_model_id}:{atr_model_id}"
+
+    def get_submission(self,
+                       key: str) -> tuple | None:
+        """ Get process ID and scale of a cached submission (None if there is none).
+
+        :param key: the cache key
+        """
+
+        with self._lock:
+            row = self._connection.execute("SELECT process_id, scale FROM entries WHERE key = ? AND created > ?",
+                                           (key, time.time() - self.max_age)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._connection:
+                self._connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+
+            return row
+
+    def put_submission(self,
+                       key: str,
+                       process_id: str,
+                       scale: float = 1.0) -> None:
+        """ Cache a submission.
+
+        :param key: the cache key
+        :param process_id: the Transkribus Processing API "processId" parameter
+        :param scale: factor of the original to the uploaded image, defaults to 1.0
+        """
+
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, NULL, ?, ?)",
+                                     (key, str(process_id), scale, now, now))
+
+    def get_result(self,
+                   process_id: str) -> dict | None:
+        """ Get a cached result (None if there is none).
+
+        :param process_id: the Transkribus Processing API "processId" parameter
+        """
+
+        with self._lock:
+            row = self._connection.execute("SELECT result FROM entries WHERE process_id = ? AND result IS NOT NULL "
+                                           "AND created > ?",
+                                           (str(process_id), time.time() - self.max_age)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+            return json.loads(row[0])
+
+    def put_result(self,
+                   process_id: str,
+                   result: dict) -> None:
+        """ Cache a result for all submissions with a process ID.
+
+        :param process_id: the Transkribus Processing API "processId" parameter
+        :param result: the result
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE entries SET result = ?, accessed = ? WHERE process_id = ?",
+                                     (json.dumps(result), time.time(), str(process_id)))
+
+    def evict(self) -> None:
+        """ Evict entries older than max_age and the least recently used entries beyond max_entries. """
+
+        with self._lock, self._connection:
+            expired = self._connection.execute("DELETE FROM entries WHERE created <= ?",
+                                               (time.time() - self.max_age,)).rowcount
+            excess = self._connection.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                                              "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                                              (self.max_entries,)).rowcount
+        if expired or excess:
+            logging.info(f"Cache {self.file_path}: evicted {expired} expired and {excess} excess entries.")
+
+    def log_statistics(self) -> None:
+        """ Log hit and miss counters. """
+
+        logging.info(f"Cache {self.file_path}: {self.hits} hits, {self.misses} misses.")
+
+    def close(self) -> None:
+        """ Close the SQLite connection. """
+
+        self._connection.close()
@@ -3,17 +3,35 @@
 Client class. """
 
 from __future__ import annotations
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dataclasses import dataclass
-from metagrapho_tropy.item import Item
-from metagrapho_tropy.api import TranskribusProcessingAPI
+from itertools import islice
+from metagrapho_tropy.cache import Cache
+from metagrapho_tropy.delta import Delta
+from metagrapho_tropy.item import Item, ItemView
+from metagrapho_tropy.journal import Journal
+from metagrapho_tropy.metrics import Metrics
+from metagrapho_tropy.poller import Poller
+from metagrapho_tropy.prefetcher import Prefetcher
+from metagrapho_tropy.resolver import PathResolver
+from metagrapho_tropy.store import ResultStore
 from metagrapho_tropy.tropy import Tropy
 from metagrapho_tropy.utility import Utility
-import base64
+from metagrapho_tropy.workqueue import WorkQueue
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
 import json
 import logging
 import os.path
+import queue
+import socket
+import threading
 import time
 
+if TYPE_CHECKING:  # imported on first use, see Client._connect
+    from metagrapho_tropy.api import TranskribusProcessingAPI
+    from metagrapho_tropy.preprocessor import Preprocessor
+
 
 @dataclass
 class Client:
@@ -23,50 +41,77 @@ class Client:
      :param password: User's Transkribus password, defaults to None
      :param api: Transkribus metagrapho API wrapper instance, defaults to None
      :param processing_data: map of item IDs to Transkribus metagrapho API processing IDs, defaults to None
+     :param max_workers: number of threads submitting images concurrently, defaults to 4
+     :param max_in_flight: maximum number of images queued or being submitted at once, defaults to None (= twice
+     max_workers)
+     :param preprocessor: image downscaling and recompression before upload, defaults to None (= upload originals)
+     :param cache: cache of submissions and results deduplicating images by content, defaults to None (= no cache)
+     :param prefetcher: read-ahead of the image files overlapping their loading with uploads, defaults to None (= read
+     while uploading)
+     :param compact: toggle compact JSON output instead of pretty-printed output, defaults to False
+     :param enforce_quota: refuse to submit more images than the user has credits left instead of only warning,
+     defaults to True
+     :param metrics: per-stage counters and histograms, defaults to None (= new Metrics instance)
+     :param metrics_save_path: complete path to metrics save file including file extension, saved at the end of every
+     run as Prometheus text file if the extension is '.prom' and as JSON summary otherwise, defaults to None (= not
+     saved)
      """
 
     user: str = None
     password: str = None
     api: TranskribusProcessingAPI = None
     processing_data: list = None
+    max_workers: int = 4
+    max_in_flight: int = None
+    preprocessor: Preprocessor = None
+    cache: Cache = None
+    prefetcher: Prefetcher = None
+    compact: bool = False
+    enforce_quota: bool = True
+    metrics: Metrics = None
+    metrics_save_path: str = None
 
     def __post_init__(self):
-        logging.basicConfig(level=logging.DEBUG,
-                            format="%(asctime)s %(levelname)s:%(name)s:%(message)s",
-                            handlers=[logging.FileHandler(f"metagrapho_tropy_{time.strftime('%Y%m%d-%H%M%S')}.log"),
-                                      logging.StreamHandler(),
-                                      ]
-                            )
-        logging.info(
-            f"Started Client.")
-        if self.user is None or self.password is None:
-            try:
-                from metagrapho_tropy.credentials import TRANSKRIBUS_USER, TRANSKRIBUS_PASSWORD
-                self.user = TRANSKRIBUS_USER
-                self.password = TRANSKRIBUS_PASSWORD
-                self.api = TranskribusProcessingAPI(user=self.user,
-                                                    password=self.password)
-            except (ModuleNotFoundError, ImportError):
-                logging.critical(f"File 'credentials.py' not found or not valid!")
-                raise
+        if not logging.getLogger().handlers:  # configure logging once per process, not once per client
+            logging.basicConfig(level=logging.DEBUG,
+                                format="%(asctime)s %(levelname)s:%(name)s:%(message)s",
+                                handlers=[logging.FileHandler(f"metagrapho_tropy_{time.strftime('%Y%m%d-%H%M%S')}.log",
+                                                              delay=True),
+                                          logging.StreamHandler(),
+                                          ]
+                                )
         self.processing_data = []
+        if self.metrics is None:
+            self.metrics = Metrics()
+        if self.api is not None and self.api.metrics is None:
+            self.api.metrics = self.metrics
+        if self.max_in_flight is None:
+            self.max_in_flight = 2 * self.max_workers
 
-    @staticmethod
-    def _repath(image_path: str,
-                lowest_common_dir: str
-                ) -> str:
-        """ Refactor a Tropy image path from machine X to be used on machine Y given the lowest common directory of X
-        and Y.
-
-        :param image_path: the Tropy image path
-        :param lowest_common_dir: the lowest common directory
+    def _connect(self) -> TranskribusProcessingAPI:
+        """ Get the Transkribus metagrapho API wrapper, creating it on first use.
+
+        The API wrapper (and with it requests) is only imported and created when a run needs the API, so that
+        Client.enrich_tropy works without credentials and network. If Client.user or Client.password is not set, the
+        credentials are imported from 'credentials.py'. The wrapper authenticates with its first request.
         """
 
-        image_dir = lowest_common_dir.split("\\")[-1]
-        image_path_split = image_path.split("\\")
-        index = image_path_split.index(image_dir)
+        if self.api is None:
+            from metagrapho_tropy.api import TranskribusProcessingAPI
+            if self.user is None or self.password is None:
+                try:
+                    from metagrapho_tropy.credentials import TRANSKRIBUS_USER, TRANSKRIBUS_PASSWORD
+                    self.user = TRANSKRIBUS_USER
+                    self.password = TRANSKRIBUS_PASSWORD
+                except (ModuleNotFoundError, ImportError):
+                    logging.critical(f"File 'credentials.py' not found or not valid!")
+                    raise
+            self.api = TranskribusProcessingAPI(user=self.user,
+                                                password=self.password,
+                                                pool_size=self.max_workers,
+                                                metrics=self.metrics)
 
-        return "\\".join(lowest_common_dir.split("\\") + image_path_split[index + 1:])
+        return self.api
 
     @staticmethod
     def _validate(tropy_file_path: str,
@@ -79,6 +124,9 @@ class Client:
                   line_model_id: int = None,
                   atr_model_id: int = None,
                   lowest_common_dir: str = None,
+                  journal_path: str = None,
+                  resume: bool = False,
+                  stream: bool = False,
                   ) -> Tropy:
         """ Validate user input and initialize Tropy instance.
 
@@ -91,10 +139,16 @@ class Client:
         :param line_model_id: the Transkribus line model ID, defaults to None
         :param atr_model_id: the Transkribus ATR model ID, defaults to None
         :param lowest_common_dir: lowest common directory, defaults to None
+        :param journal_path: complete path to JSONL journal file including file extension, defaults to None
+        :param resume: resume from the journal, defaults to False
+        :param stream: stream the Tropy export item by item instead of loading it, defaults to False
         """
 
         try:
-            tropy = Tropy(json_export=Utility.load_json(file_path=tropy_file_path))
+            if stream:
+                tropy = Tropy.stream(file_path=tropy_file_path)
+            else:
+                tropy = Tropy(json_export=Utility.load_json(file_path=tropy_file_path))
         except FileNotFoundError:
             logging.critical(f"Invalid 'tropy_file_path' parameter: file '{tropy_file_path}' not found!")
             raise
@@ -112,7 +166,7 @@ class Client:
         if mapping_save_path is not None:
             pass
             # TODO: add validation for mapping_save_path
-        if item_type is not None:
+        if item_type is not None and not stream:  # the items of a streamed export can only be read once
             try:
                 assert item_type in tropy.get_types()
             except AssertionError:
@@ -136,49 +190,127 @@ class Client:
                 logging.critical(
                     f"Invalid 'lowest_common_dir' parameter: directory '{lowest_common_dir}' does not exist!")
                 raise
+        if resume:
+            try:
+                assert journal_path is not None
+            except AssertionError:
+                logging.critical(f"Invalid 'resume' parameter: cannot resume without 'journal_path'!")
+                raise
 
         return tropy
 
     @staticmethod
     def _load_mapping(mapping_file_path: str) -> dict:
-        """ Load mapping as dictionary with Tropy item ID as key and list of image index, processing ID as value. """
+        """ Load mapping as dictionary with Tropy item ID as key and list of rows of image index, processing ID (and
+        scale, if present) as value, one row per image. Rows repeating an (item ID, image index, processing ID)
+        triple are skipped. """
 
         list_map = Utility.load_csv(file_path=mapping_file_path)
         dict_map = dict()
         for row in list_map[1:]:
-            dict_map[row[0]] = [row[1], row[2]]
+            rows = dict_map.setdefault(row[0], [])
+            if not any(existing[:2] == row[1:3] for existing in rows):
+                rows.append(row[1:4])
 
         return dict_map
 
+    @staticmethod
+    def _load_download(download_file_path: str) -> dict | ResultStore:
+        """ Load download as dictionary with Tropy item ID as key and list of entries of image index, processing ID,
+        result (and scale, if present) as value, one entry per image.
+
+        Download files of previous versions hold a single entry per item instead of a list of entries; their entries
+        are wrapped in a list. An SQLite result store is returned as is, its entries are read per item.
+
+        :param download_file_path: complete path to JSON download file or SQLite result store including file
+            extension
+        """
+
+        if ResultStore.is_store(file_path=download_file_path):
+            return ResultStore(file_path=download_file_path)
+        download = Utility.load_json(file_path=download_file_path)
+        for key, entries in download.items():
+            if entries and not isinstance(entries[0], list):
+                download[key] = [entries]
+
+        return download
+
+    @staticmethod
+    def _load_manifest(manifest_file_path: str) -> list:
+        """ Load and validate a batch manifest as list of dictionaries with the parameters of each Tropy export (see
+        Client.batch).
+
+        :param manifest_file_path: complete path to JSON manifest file including file extension
+        """
+
+        keys = {"tropy_file_path", "tropy_save_path", "mapping_save_path", "item_type", "item_tag",
+                "item_image_index", "lowest_common_dir"}
+        manifest = Utility.load_json(file_path=manifest_file_path)
+        try:
+            assert isinstance(manifest, list)
+            for entry in manifest:
+                assert isinstance(entry, dict) and "tropy_file_path" in entry and entry.keys() <= keys
+        except AssertionError:
+            logging.critical(f"Invalid 'manifest_file_path' parameter: file '{manifest_file_path}' is not a list of "
+                             f"exports with 'tropy_file_path' and the optional keys {sorted(keys)}!")
+            raise
+
+        return manifest
+
     def _process_image(self,
-                       item: Item,
+                       item: Item | ItemView,
                        item_image_index: int,
                        line_model_id: int = None,
                        atr_model_id: int = None,
-                       lowest_common_dir: str = None
-                       ) -> None:
-        """ Process a single image.
+                       image_data: Future = None
+                       ) -> list | None:
+        """ Process a single image and return its row of processing data (None if the image is missing or was not
+        accepted by the API).
 
         :param item: a Tropy item
         :param item_image_index: the selected item's index
         :param line_model_id: the Transkribus line model ID, defaults to None
         :param atr_model_id: the Transkribus ATR model ID, defaults to None
-        :param lowest_common_dir: lowest common directory, defaults to None
+        :param image_data: future of the image file's content loaded by Client.prefetcher, released once the image is
+            processed, defaults to None (= read the image file while uploading)
         """
 
         try:
             image_path = os.path.normpath(item.photo[item_image_index]["path"])
-            if lowest_common_dir is not None:
-                image_path = self._repath(image_path=image_path,
-                                          lowest_common_dir=os.path.normpath(lowest_common_dir))
-            with open(image_path, "rb") as image_file:
-                encoded_image = base64.b64encode(image_file.read())
-            post_response = self.api.post_processes(line_model_id=line_model_id,
-                                                    atr_model_id=atr_model_id,
-                                                    image=encoded_image.decode("utf-8"))
+            data = None if image_data is None else image_data.result()
+            cache_key = None
+            if self.cache is not None:
+                content_hash = Cache.hash_file(file_path=image_path) if data is None else Cache.hash_data(data=data)
+                cache_key = Cache.key(content_hash=content_hash,
+                                      line_model_id=line_model_id,
+                                      atr_model_id=atr_model_id)
+                cached = self.cache.get_submission(key=cache_key)
+                if cached is not None:
+                    logging.info(f"Item {item.identifier} image {item_image_index} has cached process ID {cached[0]}.")
+                    return [item.identifier, item_image_index, cached[0], cached[1]]
+            upload_path, scale = image_path, 1.0
+            if self.preprocessor is not None:
+                with self.metrics.timer("preprocess_seconds"):
+                    upload_path, scale = self.preprocessor.preprocess(image_path=image_path)
+            try:
+                post_response = self.api.post_processes_from_file(line_model_id=line_model_id,
+                                                                  atr_model_id=atr_model_id,
+                                                                  image_path=upload_path,
+                                                                  data=data if upload_path == image_path else None)
+            finally:
+                if upload_path != image_path:
+                    os.remove(upload_path)
+            if post_response.status_code != 200:
+                logging.warning(f"Item {item.identifier} image {item_image_index} not submitted, HTTP "
+                                f"{post_response.status_code}!")
+                return None
             process_id = post_response.json()["processId"]
-            self.processing_data.append([item.identifier, item_image_index, process_id])
+            if cache_key is not None:
+                self.cache.put_submission(key=cache_key,
+                                          process_id=process_id,
+                                          scale=scale)
             logging.info(f"Item {item.identifier} image {item_image_index} has process ID {process_id}.")
+            return [item.identifier, item_image_index, process_id, scale]
         except IndexError:
             logging.warning(f"Item {item.identifier} has no image with index {item_image_index}!")
         except TypeError:
@@ -186,6 +318,284 @@ class Client:
         except:
             logging.exception(f"Unexpected exception with item {item.identifier}.")
             raise
+        finally:
+            if image_data is not None:
+                self.prefetcher.release(image_data)
+
+    @staticmethod
+    def _resolve_paths(jobs: list,
+                       lowest_common_dir: str = None,
+                       journal: Journal = None) -> list:
+        """ Resolve the image paths of all jobs before any image is submitted and return the jobs whose images exist.
+
+        With a lowest common directory, the Tropy image paths are resolved in bulk against an index of the files below
+        it (see the PathResolver class), otherwise they are used as they are. Missing images are logged and their jobs
+        dropped. Jobs with an invalid image index (logged by Client._process_image) and journaled jobs are kept as
+        they are.
+
+        :param jobs: list of (Tropy item, image index) tuples
+        :param lowest_common_dir: lowest common directory, defaults to None
+        :param journal: journal of submissions, defaults to None
+        """
+
+        photos = []
+        for item, item_image_index in jobs:
+            try:
+                photo = item.photo[item_image_index]
+            except (IndexError, TypeError):
+                photo = None
+            if journal is not None and journal.get(item.identifier, item_image_index) is not None:
+                photo = None
+            photos.append(photo)
+
+        paths = {photo["path"] for photo in photos if photo is not None and "path" in photo}
+        if lowest_common_dir is None:
+            resolved = {path: os.path.normpath(path) if os.path.isfile(path) else None for path in paths}
+        else:
+            resolved = PathResolver(root_dir=lowest_common_dir).resolve_all(paths=paths)
+
+        resolved_jobs = []
+        for (item, item_image_index), photo in zip(jobs, photos):
+            if photo is not None:
+                if resolved.get(photo.get("path")) is None:
+                    logging.warning(f"Item {item.identifier} image {item_image_index} not found at "
+                                    f"'{photo.get('path')}'!")
+                    continue
+                photo["path"] = resolved[photo["path"]]
+            resolved_jobs.append((item, item_image_index))
+        if len(resolved_jobs) < len(jobs):
+            logging.warning(f"{len(jobs) - len(resolved_jobs)} of {len(jobs)} queued images not found, they are not "
+                            f"submitted.")
+
+        return resolved_jobs
+
+    def _finish_run(self,
+                    name: str,
+                    start: float) -> None:
+        """ Shut down the process pool of the preprocessor, observe the duration of a run and save the metrics if
+        Client.metrics_save_path is set.
+
+        :param name: the name of the run
+        :param start: the start of the run (time.perf_counter)
+        """
+
+        if self.preprocessor is not None:
+            self.preprocessor.close()
+        self.metrics.observe(f"{name}_seconds", time.perf_counter() - start)
+        if self.metrics_save_path is not None:
+            self.metrics.save(file_path=self.metrics_save_path)
+            logging.info(f"Metrics saved to {self.metrics_save_path}.")
+
+    def _check_quota(self,
+                     jobs: list,
+                     journal: Journal = None) -> None:
+        """ Check the user's remaining credits before submitting images, assuming one credit per image.
+
+        If the images exceed the remaining credits, the batch is refused if Client.enforce_quota is set, otherwise a
+        warning is logged. Images already recorded in the journal are not counted.
+
+        :param jobs: list of (Tropy item, image index) tuples
+        :param journal: journal of submissions, defaults to None
+        """
+
+        images = sum(1 for item, item_image_index in jobs
+                     if journal is None or journal.get(item.identifier, item_image_index) is None)
+        remaining = self.api.get_credits()
+        if remaining is None:
+            logging.warning(f"Remaining credits unknown, quota of {images} images not checked.")
+        elif images > remaining:
+            if self.enforce_quota:
+                logging.critical(f"{images} images exceed the remaining {remaining:g} credits!")
+                raise ValueError(f"{images} images exceed the remaining {remaining:g} credits.")
+            logging.warning(f"{images} images exceed the remaining {remaining:g} credits.")
+        else:
+            logging.info(f"{images} images to submit, {remaining:g} credits remaining.")
+
+    def _process_images(self,
+                        jobs: list,
+                        line_model_id: int = None,
+                        atr_model_id: int = None,
+                        journal: Journal = None,
+                        callback: Callable[[list, int], None] = None,
+                        stop: threading.Event = None
+                        ) -> None:
+        """ Process images concurrently and append their processing data in job order.
+
+        At most Client.max_workers images are submitted at the same time and at most Client.max_in_flight jobs are
+        queued or running, so that the processing data stays deterministic however the submissions interleave.
+        Images already recorded in the journal are not submitted again. The callback receives every row of processing
+        data as soon as it is available, in completion order. Once the stop event is set or a submission, the journal
+        or the callback has raised, no further image is submitted and the queued submissions are cancelled; the rows of
+        the completed submissions are appended before the exception is raised.
+
+        :param jobs: list of (Tropy item, image index) tuples
+        :param line_model_id: the Transkribus line model ID, defaults to None
+        :param atr_model_id: the Transkribus ATR model ID, defaults to None
+        :param journal: journal of submissions, defaults to None
+        :param callback: function called with each row of processing data and the position of its job, defaults to
+            None
+        :param stop: event stopping the submissions, defaults to None
+        """
+
+        failures = []  # exceptions of the journal and the callback, raised in done callbacks of the submissions
+
+        def record(future, position):
+            if future.exception() is None and future.result() is not None:
+                try:
+                    if journal is not None:
+                        journal.append(row=future.result())
+                    if callback is not None:
+                        callback(future.result(), position)
+                except Exception as exception:
+                    logging.exception(f"Unexpected exception recording item {future.result()[0]} image "
+                                      f"{future.result()[1]}.")
+                    failures.append(exception)
+
+        loads = None
+        if self.prefetcher is not None:
+            paths = []
+            for item, item_image_index in jobs:
+                if (journal is not None and journal.get(item.identifier, item_image_index) is not None) \
+                        or not 0 <= item_image_index < len(item.photo or []):
+                    paths.append(None)
+                else:
+                    paths.append(os.path.normpath(item.photo[item_image_index]["path"]))
+            loads = self.prefetcher.prefetch(paths=paths)
+
+        results, error = dict(), None
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = dict()
+
+                def collect(futures: set) -> None:
+                    nonlocal error
+                    for future in futures:
+                        position = pending.pop(future)
+                        if future.cancelled():
+                            continue
+                        if future.exception() is not None:
+                            error = error or future.exception()
+                        else:
+                            results[position] = future.result()
+
+                for position, (item, item_image_index) in enumerate(jobs):
+                    if error is not None or failures or (stop is not None and stop.is_set()):
+                        logging.warning(f"Submissions stopped, {len(jobs) - position} queued images not submitted.")
+                        for future in pending:
+                            future.cancel()
+                        break
+                    if journal is not None and journal.get(item.identifier, item_image_index) is not None:
+                        results[position] = journal.get(item.identifier, item_image_index)
+                        logging.info(f"Item {item.identifier} image {item_image_index} skipped (journaled).")
+                        if callback is not None:
+                            callback(results[position], position)
+                        continue
+                    if len(pending) >= self.max_in_flight:
+                        collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+                    future = executor.submit(self._process_image,
+                                             item=item,
+                                             item_image_index=item_image_index,
+                                             line_model_id=line_model_id,
+                                             atr_model_id=atr_model_id,
+                                             image_data=None if loads is None else loads[position])
+                    if journal is not None or callback is not None:
+                        future.add_done_callback(lambda done, position=position: record(done, position))
+                    pending[future] = position
+                collect(wait(pending)[0])
+        finally:
+            if loads is not None:
+                self.prefetcher.cancel(futures=loads)
+            for position in sorted(results):
+                if results[position] is not None:
+                    self.processing_data.append(results[position])
+        if error is not None or failures:
+            raise error or failures[0]
+
+    @staticmethod
+    def _select_items(graph: Iterable[dict],
+                      jobs: list,
+                      item_type: str = None,
+                      item_tag: str = None,
+                      item_image_index: int = None,
+                      ) -> Iterator[dict]:
+        """ Yield all items of a Tropy graph, queueing the images of the selected items as jobs.
+
+        The queued jobs only hold the item ID and the image paths, so that the items of a streamed Tropy export do
+        not have to be kept in memory. The items are not tagged (see Client._tag_items).
+
+        :param graph: the Tropy items
+        :param jobs: list to which (Tropy item, image index) tuples are appended
+        :param item_type: the item type, defaults to None
+        :param item_tag: the item tag, defaults to None
+        :param item_image_index: the selected item's index, defaults to None
+        """
+
+        for item in graph:
+            parsed_item = ItemView(item)
+
+            # check exclusion criteria:
+            if item_type is not None:
+                if parsed_item.type != item_type:
+                    yield item
+                    continue
+            if item_tag is not None:
+                try:
+                    if item_tag not in parsed_item.tag:
+                        yield item
+                        continue
+                except TypeError:
+                    yield item
+                    continue
+            try:
+                if "atr_processed" in parsed_item.tag:  # TODO: perhaps better via metadata field w/ process ID?
+                    logging.info(f"Item {parsed_item.identifier} skipped (already processed).")
+                    yield item
+                    continue
+            except TypeError:
+                pass
+
+            # queue item:
+            job_item = ItemView({"identifier": parsed_item.identifier})
+            if parsed_item.photo is not None:
+                job_item.photo = [{"path": photo["path"]} if "path" in photo else {} for photo in parsed_item.photo]
+            if item_image_index is None:
+                try:
+                    jobs.extend((job_item, i) for i in range(len(job_item.photo)))
+                except TypeError:
+                    logging.warning(f"Item {parsed_item.identifier} has no image!")
+            else:
+                jobs.append((job_item, item_image_index))
+            logging.info(f"Item {parsed_item.identifier} queued.")
+            yield item
+
+    @staticmethod
+    def _tag_item(item: dict) -> None:
+        """ Tag a Tropy item as processed unless it is tagged already.
+
+        :param item: the Tropy item
+        """
+
+        try:
+            if "atr_processed" not in item["tag"]:
+                item["tag"].append("atr_processed")
+        except KeyError:
+            item["tag"] = ["atr_processed"]
+
+    @staticmethod
+    def _tag_items(graph: Iterable[dict],
+                   item_ids: set) -> Iterator[dict]:
+        """ Yield all items of a Tropy graph, tagging the items with at least one submitted or journaled image as
+        processed. Items whose images were all missing stay untagged, so that they are selected again by the next
+        run.
+
+        :param graph: the Tropy items
+        :param item_ids: the IDs of the items with a row of processing data
+        """
+
+        for item in graph:
+            if item.get("identifier") in item_ids:
+                Client._tag_item(item)
+            yield item
 
     def process_tropy(self,
                       tropy_file_path: str,
@@ -197,17 +607,36 @@ class Client:
                       line_model_id: int = 49272,
                       atr_model_id: int = 39995,
                       lowest_common_dir: str = None,
+                      journal_path: str = None,
+                      resume: bool = False,
+                      stream: bool = False,
+                      delta_format: str = None,
+                      work_queue_path: str = None,
                       ) -> None:
         """ Process selected Tropy items to yield image to text transcriptions.
 
         Provide a Tropy export JSON-LD file. Items are selected via type and tag (optional and conjunctive). If no
         selection is made, all items are enriched. Images are selected via their index. If no specific image is
-        selected, image to text is applied to all images. Processed items get the tag "atr_processed" and are saved
-        to an updated JSON-LD file; in addition, there is a CSV file mapping items to processing IDs. The Transkribus
-        Processing API generates the transcription based on a layout detection model and an ATR model,
-        both customizable via their IDs. If the Tropy image paths do not correspond to the image paths on the machine
-        running this module, provide the losest common directory shared by both paths. Use the Client.download method
-        to download the transcription from the Transkribus Processing API (do this within at most 24 hours).
+        selected, image to text is applied to all images. Items with at least one submitted image get the tag
+        "atr_processed" and are saved to an updated JSON-LD file; in addition, there is a CSV file mapping items to
+        processing IDs. The Transkribus Processing API generates the transcription based on a layout detection model and
+        an ATR model, both customizable via their IDs. If the Tropy image paths do not correspond to the image paths on
+        the machine running this module, provide the losest common directory shared by both paths; the image paths are
+        resolved against an index of the files below it (see the PathResolver class). Missing images are reported before
+        any image is submitted and skipped; items without any submitted image stay untagged, so that a rerun retries
+        them. Images are submitted concurrently (see Client.max_workers and Client.max_in_flight), the mapping keeps the
+        order of the Tropy export. Use the Client.download method to download the transcription from the Transkribus
+        Processing API (do this within at most 24 hours). The user's remaining credits are checked before the images are
+        submitted (see Client.enforce_quota). Provide a journal to record every submission as it happens; if a run is
+        interrupted, rerun it with the same journal and resume=True to skip the images submitted already. For very large
+        exports, stream=True reads and writes the export item by item; it is read twice, once to queue the images and
+        once to save the updated export after the images are submitted. With a delta format, only the tagged items are
+        saved instead of the complete export (see the Delta class); a JSON-LD subset can be enriched with
+        Client.enrich_tropy like a complete export and merged into the export with Client.merge_tropy. To share the
+        submissions with other processes or hosts, provide a work queue on shared storage: the images are put into the
+        queue, submitted by this client and any workers running Client.work on the same queue, and the mapping is merged
+        from the queue once all images are submitted. Rerun with the same work queue to resume an interrupted run (the
+        journal is not used).
 
         :param tropy_file_path: complete path to Tropy export file including file extension
         :param tropy_save_path: complete path to updated Tropy save file including file extension, defaults to None
@@ -218,6 +647,13 @@ class Client:
         :param line_model_id: the Transkribus line model ID, defaults to 49272 (= Mixed Text Line Orientation)
         :param atr_model_id: the Transkribus ATR model ID, defaults to 39995 (= Transkribus Print M1)
         :param lowest_common_dir: the lowest common directory, defaults to None
+        :param journal_path: complete path to JSONL journal file including file extension, defaults to None
+        :param resume: resume from the journal instead of starting a new one, defaults to False
+        :param stream: stream the Tropy export item by item instead of loading it, defaults to False
+        :param delta_format: save only the tagged items as 'jsonld' (= JSON-LD subset) or 'patch' (= JSON Patch)
+            instead of the updated export, defaults to None (= save the updated export)
+        :param work_queue_path: complete path to SQLite work queue file including file extension, defaults to None (=
+            submit all images in this process)
         """
 
         logging.info(
@@ -228,7 +664,15 @@ class Client:
             f"item_tag={item_tag}), "
             f"line_model_id={line_model_id}), "
             f"atr_model_id={atr_model_id}), "
-            f"lowest_common_dir={lowest_common_dir}).")
+            f"lowest_common_dir={lowest_common_dir}), "
+            f"journal_path={journal_path}), "
+            f"resume={resume}), "
+            f"stream={stream}), "
+            f"delta_format={delta_format}), "
+            f"work_queue_path={work_queue_path}).")
+        start = time.perf_counter()
+        delta = None if delta_format is None else Delta(delta_format=delta_format)
+        self._connect()
 
         tropy = self._validate(tropy_file_path=tropy_file_path,
                                tropy_save_path=tropy_save_path,
@@ -238,169 +682,912 @@ class Client:
                                item_image_index=item_image_index,
                                line_model_id=line_model_id,
                                atr_model_id=atr_model_id,
-                               lowest_common_dir=lowest_common_dir)
+                               lowest_common_dir=lowest_common_dir,
+                               journal_path=journal_path,
+                               resume=resume,
+                               stream=stream)
 
-        for item in tropy.graph:
-            parsed_item = Item()
-            parsed_item.copy_metadata_from_dict(item)
+        if tropy_save_path is None:
+            tropy_save_path = "".join(
+                tropy_file_path.split(".")[:-1] + [f"_updated_{time.strftime('%Y%m%d-%H%M%S')}.json"])
+        if mapping_save_path is None:
+            mapping_save_path = f"mapping_{time.strftime('%Y%m%d-%H%M%S')}.csv"
 
-            # check exclusion criteria:
-            if item_type is not None:
-                if parsed_item.type != item_type:
-                    continue
-            if item_tag is not None:
-                try:
-                    if item_tag not in parsed_item.tag:
-                        continue
-                except TypeError:
-                    continue
-            try:
-                if "atr_processed" in parsed_item.tag:  # TODO: perhaps better via metadata field w/ process ID?
-                    logging.info(f"Item {parsed_item.identifier} skipped (already processed).")
-                    continue
-            except TypeError:
-                pass
+        jobs, before = [], len(self.processing_data)
+        if tropy.streamed:
+            selected = self._select_items(graph=tropy.graph,
+                                          jobs=jobs,
+                                          item_type=item_type,
+                                          item_tag=item_tag,
+                                          item_image_index=item_image_index)
+        else:
+            selected = self._select_items(graph=tropy.get_items(item_type=item_type,
+                                                                item_tag=item_tag),
+                                          jobs=jobs,
+                                          item_image_index=item_image_index)
+        deque(selected, maxlen=0)
 
-            # process item:
-            if item_image_index is None:
-                i = 0
-                while i < len(parsed_item.photo):
-                    self._process_image(item=parsed_item,
-                                        item_image_index=i,
-                                        lowest_common_dir=lowest_common_dir)
-                    i += 1
-            else:
-                self._process_image(item=parsed_item,
-                                    item_image_index=item_image_index,
+        if work_queue_path is not None:
+            self._check_quota(jobs=jobs)
+            work_queue = WorkQueue(file_path=work_queue_path)
+            try:
+                work_queue.put_jobs(jobs=jobs,
                                     line_model_id=line_model_id,
-                                    atr_model_id=atr_model_id,
-                                    lowest_common_dir=lowest_common_dir)
-
+                                    atr_model_id=atr_model_id)
+                self.work(work_queue_path=work_queue_path,
+                          lowest_common_dir=lowest_common_dir)
+                self.processing_data[before:] = work_queue.get_rows()  # the rows of all workers
+            finally:
+                work_queue.close()
+        else:
+            journal = None
+            if journal_path is not None:
+                journal = Journal(file_path=journal_path,
+                                  resume=resume)
             try:
-                item["tag"].append("atr_processed")
-            except KeyError:
-                item["tag"] = ["atr_processed"]
-            logging.info(f"Item {parsed_item.identifier} processed.")
+                jobs = self._resolve_paths(jobs=jobs,
+                                           lowest_common_dir=lowest_common_dir,
+                                           journal=journal)
+                self._check_quota(jobs=jobs,
+                                  journal=journal)
+                self._process_images(jobs=jobs,
+                                     line_model_id=line_model_id,
+                                     atr_model_id=atr_model_id,
+                                     journal=journal)
+            except:
+                if len(self.processing_data) > before:  # keep the process IDs of the images submitted already
+                    Utility.save_csv(header=["item_id", "photo_index", "process_id", "scale"],
+                                     data=self.processing_data,
+                                     file_path=mapping_save_path)
+                    logging.warning(f"Map of the {len(self.processing_data) - before} images submitted before the "
+                                    f"error saved to {mapping_save_path}.")
+                raise
+            finally:
+                if journal is not None:
+                    journal.close()
+        logging.info(f"{len(self.processing_data)} images of {len(jobs)} queued images processed.")
+        if self.cache is not None:
+            self.cache.evict()
+            self.cache.log_statistics()
 
-        if mapping_save_path is None:
-            mapping_save_path = f"mapping_{time.strftime('%Y%m%d-%H%M%S')}.csv"
-        Utility.save_csv(header=["item_id", "photo_index", "process_id"],
+        Utility.save_csv(header=["item_id", "photo_index", "process_id", "scale"],
                          data=self.processing_data,
                          file_path=mapping_save_path)
         logging.info(
             f"Map of map of item IDs to Transkribus metagrapho API processing IDs saved to {mapping_save_path}.")
 
-        if tropy_save_path is None:
-            tropy_save_path = "".join(
-                tropy_file_path.split(".")[:-1] + [f"_updated_{time.strftime('%Y%m%d-%H%M%S')}.json"])
-        Utility.save_json(data=tropy.json_export,
-                          file_path=tropy_save_path)
-        logging.info(f"Updated Tropy export JSON-LD file saved to {tropy_save_path}.")
+        processed = {row[0] for row in self.processing_data[before:]}
+        if tropy.streamed:  # the items of a streamed export can only be read once
+            tropy = Tropy.stream(file_path=tropy_file_path)
+        tagged = self._tag_items(graph=tropy.graph,
+                                 item_ids=processed)
+        if delta is not None:  # the delta needs the graph positions of all items
+            deque(delta.track(graph=tagged,
+                              changed=lambda item: item.get("identifier") in processed), maxlen=0)
+            delta.save(members=tropy.json_export,
+                       file_path=tropy_save_path,
+                       compact=self.compact,
+                       leading=tropy.leading_members)
+        else:
+            if tropy.streamed:
+                tropy.graph = tagged
+            else:
+                deque(tagged, maxlen=0)
+            tropy.save(file_path=tropy_save_path,
+                       compact=self.compact)
+            logging.info(f"Updated Tropy export JSON-LD file saved to {tropy_save_path}.")
 
+        self._finish_run(name="process_tropy",
+                         start=start)
         logging.info(f"Finished Client.process_tropy.")
 
+    def work(self,
+             work_queue_path: str,
+             lowest_common_dir: str = None,
+             worker: str = None,
+             poll_interval: float = 1.0,
+             ) -> None:
+        """ Submit images of a work queue shared with a coordinator (see Client.process_tropy) until all its images
+        are submitted.
+
+        The worker waits until the coordinator has put the images into the queue, then claims batches of
+        Client.max_in_flight images, resolves their paths on this machine, submits them and writes back their rows
+        of processing data. Images which cannot be submitted or written back because of an error are returned to the
+        queue and the error is raised. The worker returns once no image is left, including images claimed by other
+        workers whose lease may still expire.
+
+        :param work_queue_path: complete path to SQLite work queue file including file extension
+        :param lowest_common_dir: the lowest common directory on this machine, defaults to None
+        :param worker: the name of the worker, defaults to None (= host name and process ID)
+        :param poll_interval: time in seconds between two looks at the queue while waiting, defaults to 1.0
+        """
+
+        if worker is None:
+            worker = f"{socket.gethostname()}-{os.getpid()}"
+        logging.info(
+            f"Started Client().work(work_queue_path={work_queue_path}, "
+            f"lowest_common_dir={lowest_common_dir}, "
+            f"worker={worker}, "
+            f"poll_interval={poll_interval}).")
+        start = time.perf_counter()
+        self._connect()
+
+        work_queue = WorkQueue(file_path=work_queue_path)
+        submitted = 0
+        try:
+            while (settings := work_queue.get_settings()) is None:
+                time.sleep(poll_interval)
+            while True:
+                claimed = work_queue.claim(worker=worker,
+                                           limit=self.max_in_flight)
+                if not claimed:
+                    if not work_queue.counts().get("leased"):
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                positions, jobs = dict(), []
+                for position, item_id, item_image_index, path in claimed:
+                    item = ItemView({"identifier": item_id,
+                                     "photo": None if path is None else [{} for _ in range(item_image_index)]
+                                                                        + [{"path": path}]})
+                    positions[id(item)] = position
+                    jobs.append((item, item_image_index))
+                jobs = self._resolve_paths(jobs=jobs,
+                                           lowest_common_dir=lowest_common_dir)
+                completed = set()
+
+                def write_back(row: list, job_position: int) -> None:
+                    position = positions[id(jobs[job_position][0])]
+                    work_queue.complete(position=position,
+                                        row=row)
+                    completed.add(position)
+
+                try:
+                    self._process_images(jobs=jobs,
+                                         line_model_id=settings["line_model_id"],
+                                         atr_model_id=settings["atr_model_id"],
+                                         callback=write_back)
+                except:
+                    work_queue.release(positions=[position for position in positions.values()
+                                                  if position not in completed])
+                    raise
+                for position in positions.values():  # missing images
+                    if position not in completed:
+                        work_queue.complete(position=position,
+                                            row=None)
+                submitted += len(completed)
+        finally:
+            work_queue.close()
+        logging.info(f"Worker {worker} submitted {submitted} images.")
+
+        self._finish_run(name="work",
+                         start=start)
+        logging.info(f"Finished Client.work.")
+
     def download(self,
                  mapping_file_path: str,
                  download_save_path: str = None,
+                 requests_per_second: float = 5.0,
+                 timeout: float = None,
+                 store_path: str = None,
                  ) -> None:
 
         """ Download image to text transcriptions for Tropy items from the Transkribus Processing API initialized with
         the Client.process_tropy method.
 
+        Pending processes are polled concurrently with exponential backoff until their status is FINISHED or FAILED
+        (see the Poller class), so the download can be started right after Client.process_tropy. The download JSON
+        file maps every item ID to a list of entries of image index, processing ID, result and scale, one entry per
+        processed image. Alternatively, the results are written to an SQLite result store (see the ResultStore class)
+        as soon as they are downloaded; Client.enrich_tropy accepts the store in place of the download JSON file and
+        reads it item by item, so that a partial download can be used right away.
+
         :param mapping_file_path: complete path to CSV mapping file including file extension
         :param download_save_path: complete path to download JSON save file including file extension, defaults to None
+        :param requests_per_second: global request-rate budget while polling, defaults to 5.0
+        :param timeout: time in seconds after which unfinished processes are given up, defaults to None
+        :param store_path: complete path to SQLite result store including file extension, defaults to None (= save a
+            download JSON file instead)
         """
 
         logging.info(
             f"Started Client().download(download_file_path={mapping_file_path}, "
-            f"download_save_path={download_save_path}).")
+            f"download_save_path={download_save_path}, "
+            f"requests_per_second={requests_per_second}, "
+            f"timeout={timeout}, "
+            f"store_path={store_path}).")
+        start = time.perf_counter()
+        self._connect()
 
         mapping = self._load_mapping(mapping_file_path=mapping_file_path)
+        store = None
+        if store_path is not None:
+            store = ResultStore(file_path=store_path)
+            store.put_images(mapping=mapping)
+
+        poller = Poller(api=self.api,
+                        max_workers=self.max_workers,
+                        requests_per_second=requests_per_second,
+                        timeout=timeout,
+                        metrics=self.metrics)
+        process_ids = list(dict.fromkeys(row[1] for rows in mapping.values() for row in rows))
+        cached = dict()
+        if self.cache is not None:
+            for process_id in process_ids:
+                result = self.cache.get_result(process_id=process_id)
+                if result is not None:
+                    cached[process_id] = result
+                    if store is not None:
+                        store.put_result(process_id=process_id,
+                                         result=result)
+        try:
+            results = poller.poll(process_ids=[process_id for process_id in process_ids if process_id not in cached],
+                                  callback=None if store is None else store.put_result)
+        finally:
+            if store is not None:
+                store.close()
+        if self.cache is not None:
+            for process_id, result in results.items():
+                if result is not None and result.get("status") == "FINISHED":
+                    self.cache.put_result(process_id=process_id,
+                                          result=result)
+            self.cache.log_statistics()
+        results.update(cached)
+
+        for key, rows in mapping.items():
+            for row in rows:
+                result = results[row[1]]
+                if result is None or result.get("status") != "FINISHED":
+                    status = None if result is None else result.get("status")
+                    logging.warning(f"Process {row[1]} of item {key} image {row[0]} not finished (status {status}).")
+                row.insert(2, result)
+
+        if store is not None:
+            logging.info(f"Results stored in {store_path}.")
+        else:
+            if download_save_path is None:
+                download_save_path = f"download_{time.strftime('%Y%m%d-%H%M%S')}.json"
+            Utility.save_json(data=mapping,
+                              file_path=download_save_path,
+                              compact=self.compact)
+            logging.info(f"Download JSON file saved to {download_save_path}.")
 
-        for key in mapping.keys():
+        self._finish_run(name="download",
+                         start=start)
+        logging.info(f"Finished Client.download.")
+
+    @staticmethod
+    def _enrich_item(item: dict,
+                     result: list = None,
+                     lines: bool = False,
+                     ) -> dict:
+        """ Enrich a processed Tropy item with the transcriptions of all its processed images and return it.
+
+        :param item: the Tropy item
+        :param result: the item's entries of the download JSON file (see Client._load_download), defaults to None
+        :param lines: toggle line by line transcription as selection elements, defaults to False
+        """
+
+        parsed_item = ItemView(item)
+
+        try:
+            if "atr_processed" not in parsed_item.tag:
+                return item
+        except TypeError:
+            return item
+
+        if result is None:
+            logging.warning(f"Item {parsed_item.identifier} has no result, previous processing or download failed.")
+            return item
+
+        for entry in result:
             try:
-                processing_id = mapping[key][1]
-                result = self.api.get_result(processing_id)
-                mapping[key].append(result.json())
+                image_index = int(entry[0])
+                text = entry[2]["content"]["text"]  # TODO: add metadata for transcription
+                if text == "":
+                    logging.info(f"Item {parsed_item.identifier} image {image_index} not enriched, empty "
+                                 f"transcription.")
+                    continue
+                regions = entry[2]["content"]["regions"]
+                scale = float(entry[3]) if len(entry) > 3 else 1.0
+                parsed_item.add_note_element(text=text,
+                                             photo_index=image_index)
+                if lines is True:
+                    page_lines = [line for region in regions for line in region["lines"]]
+                    boxes = Item.transform_coordinates_batch([line["coords"]["points"] for line in page_lines],
+                                                             scale=scale)
+                    for line, box in zip(page_lines, boxes):
+                        parsed_item.add_selection_element(text=line["text"],
+                                                          photo_index=image_index,
+                                                          coords=line["coords"]["points"],
+                                                          scale=scale,
+                                                          box=box)
+                logging.info(f"Successfully enriched item {parsed_item.identifier} image {image_index}.")
+            except (KeyError, TypeError):
+                logging.exception(f"Item {parsed_item.identifier} image {entry[0]} has no result, previous processing "
+                                  f"or download failed.")
             except:
-                logging.exception(f"Unexpected exception in Client.download for {key}.")
+                logging.exception(f"Unexpected exception in Client.enrich_tropy for {parsed_item.identifier}.")
                 raise
 
-        if download_save_path is None:
-            download_save_path = f"download_{time.strftime('%Y%m%d-%H%M%S')}.json"
-        Utility.save_json(data=mapping,
-                          file_path=download_save_path)
-        logging.info(f"Download JSON file saved to {download_save_path}.")
+        return item
 
-        logging.info(f"Finished Client.download.")
+    @staticmethod
+    def _enrich_shard(shard: list,
+                      lines: bool = False,
+                      ) -> list:
+        """ Enrich a shard of Tropy items in a worker process and return the enriched items with the time in seconds
+        spent on each.
+
+        :param shard: list of (Tropy item, entries of the download JSON file) tuples
+        :param lines: toggle line by line transcription as selection elements, defaults to False
+        """
+
+        enriched = []
+        for item, result in shard:
+            start = time.perf_counter()
+            enriched_item = Client._enrich_item(item=item, result=result, lines=lines)
+            enriched.append((enriched_item, time.perf_counter() - start))
+
+        return enriched
+
+    @staticmethod
+    def _enrich_items(graph: Iterable[dict],
+                      download: dict | ResultStore,
+                      lines: bool = False,
+                      max_processes: int = None,
+                      shard_size: int = 64,
+                      metrics: Metrics = None,
+                      ) -> Iterator[dict]:
+        """ Yield all items of a Tropy graph in graph order, enriching the processed items with their transcriptions.
+
+        If max_processes is set, the graph is split into shards of processed items which are enriched on a process
+        pool; the enriched items are merged back into the graph in graph order, so that the output is identical to
+        the serial enrichment.
+
+        :param graph: the Tropy items
+        :param download: the loaded download JSON file or result store (see Client._load_download)
+        :param lines: toggle line by line transcription as selection elements, defaults to False
+        :param max_processes: number of worker processes, defaults to None (= enrich serially)
+        :param shard_size: number of items per shard, defaults to 64
+        :param metrics: metrics of the enrichment time per item, defaults to None
+        """
+
+        if max_processes is None:
+            for item in graph:
+                start = time.perf_counter()
+                item = Client._enrich_item(item=item,
+                                           result=download.get(item.get("identifier")),
+                                           lines=lines)
+                if metrics is not None and "atr_processed" in (item.get("tag") or []):
+                    metrics.observe("enrich_item_seconds", time.perf_counter() - start)
+                yield item
+            return
+
+        def merge(shard: list, future) -> Iterator[dict]:
+            enriched = iter(future.result())
+            for item in shard:
+                if "atr_processed" in (item.get("tag") or []):
+                    enriched_item, seconds = next(enriched)
+                    if metrics is not None:
+                        metrics.observe("enrich_item_seconds", seconds)
+                    item.clear()
+                    item.update(enriched_item)
+                yield item
+
+        graph = iter(graph)
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=max_processes) as executor:
+            while shard := list(islice(graph, shard_size)):
+                work = [(item, download.get(item.get("identifier"))) for item in shard
+                        if "atr_processed" in (item.get("tag") or [])]
+                pending.append((shard, executor.submit(Client._enrich_shard, work, lines)))
+                if len(pending) > 2 * max_processes:
+                    yield from merge(*pending.popleft())
+            while pending:
+                yield from merge(*pending.popleft())
 
     def enrich_tropy(self,
                      tropy_file_path: str,
                      download_file_path: str,
                      tropy_save_path: str = None,
                      lines: bool = False,
+                     stream: bool = False,
+                     max_processes: int = None,
+                     delta_format: str = None,
                      ) -> None:
         """ Enrich items in a Tropy export JSON-LD with transcriptions.
 
         The transcriptions must be provided in a separate file generated by running Client.process_tropy and
-        Client.download first.
+        Client.download first. Items with several processed images are enriched with all their transcriptions;
+        download files of previous versions holding a single image per item are still supported. With a delta format,
+        only the items with transcriptions are saved instead of the complete export (see the Delta class and
+        Client.merge_tropy).
 
         :param tropy_file_path: complete path to Tropy export file including file extension
-        :param download_file_path: complete path to JSON download file including file extension
+        :param download_file_path: complete path to JSON download file or SQLite result store including file
+            extension
         :param tropy_save_path: complete path to enriched Tropy save file including file extension, defaults to None
         :param lines: toggle line by line transcription as selection elements, defaults to False
+        :param stream: stream the Tropy export item by item instead of loading it, defaults to False
+        :param max_processes: number of processes enriching items in parallel, defaults to None (= serial)
+        :param delta_format: save only the enriched items as 'jsonld' (= JSON-LD subset) or 'patch' (= JSON Patch)
+            instead of the enriched export, defaults to None (= save the enriched export)
         """
 
         logging.info(
             f"Started Client().enrich_tropy(tropy_file_path={tropy_file_path}, "
             f"download_file_path={download_file_path}),"
             f"tropy_save_path={tropy_save_path},"
-            f"lines={lines}.")
+            f"lines={lines},"
+            f"stream={stream},"
+            f"max_processes={max_processes},"
+            f"delta_format={delta_format}.")
+        start = time.perf_counter()
+        delta = None if delta_format is None else Delta(delta_format=delta_format)
 
         tropy = self._validate(tropy_file_path=tropy_file_path,
                                mapping_file_path=download_file_path,
-                               tropy_save_path=tropy_save_path)
+                               tropy_save_path=tropy_save_path,
+                               stream=stream)
 
-        download = Utility.load_json(file_path=download_file_path)
+        download = self._load_download(download_file_path=download_file_path)
+
+        # the delta needs the graph positions of all items
+        graph = tropy.graph if tropy.streamed or delta is not None else tropy.get_items(item_tag="atr_processed")
+        enriched = self._enrich_items(graph=graph,
+                                      download=download,
+                                      lines=lines,
+                                      max_processes=max_processes,
+                                      metrics=self.metrics)
+        if tropy_save_path is None:
+            tropy_save_path = "".join(tropy_file_path.split(".")[:-1] + [f"_enriched_{time.strftime('%Y%m%d-%H%M%S')}.json"])
+        try:
+            if delta is not None:
+                deque(delta.track(graph=enriched,
+                                  changed=lambda item: "atr_processed" in (item.get("tag") or [])
+                                  and download.get(item.get("identifier")) is not None), maxlen=0)
+                delta.save(members=tropy.json_export,
+                           file_path=tropy_save_path,
+                           compact=self.compact,
+                           leading=tropy.leading_members)
+            else:
+                if tropy.streamed:
+                    tropy.graph = enriched
+                else:
+                    deque(enriched, maxlen=0)
+                tropy.save(file_path=tropy_save_path,
+                           compact=self.compact)
+                logging.info(f"Enriched Tropy export JSON-LD file saved to {tropy_save_path}.")
+        finally:
+            if isinstance(download, ResultStore):
+                download.close()
+
+        self._finish_run(name="enrich_tropy",
+                         start=start)
+        logging.info(f"Finished Client.enrich_tropy.")
+
+    def merge_tropy(self,
+                    tropy_file_path: str,
+                    delta_file_path: str,
+                    tropy_save_path: str = None,
+                    ) -> None:
+        """ Merge a delta saved by Client.process_tropy or Client.enrich_tropy into a Tropy export JSON-LD.
+
+        The export is streamed item by item (see Delta.merge).
+
+        :param tropy_file_path: complete path to Tropy export file including file extension
+        :param delta_file_path: complete path to delta file including file extension
+        :param tropy_save_path: complete path to merged Tropy save file including file extension, defaults to None
+        """
+
+        logging.info(
+            f"Started Client().merge_tropy(tropy_file_path={tropy_file_path}, "
+            f"delta_file_path={delta_file_path}, "
+            f"tropy_save_path={tropy_save_path}).")
+        start = time.perf_counter()
+
+        self._validate(tropy_file_path=tropy_file_path,
+                       mapping_file_path=delta_file_path,
+                       tropy_save_path=tropy_save_path,
+                       stream=True)
+
+        if tropy_save_path is None:
+            tropy_save_path = "".join(tropy_file_path.split(".")[:-1] + [f"_merged_{time.strftime('%Y%m%d-%H%M%S')}.json"])
+        Delta.merge(tropy_file_path=tropy_file_path,
+                    delta_file_path=delta_file_path,
+                    tropy_save_path=tropy_save_path,
+                    compact=self.compact)
+
+        self._finish_run(name="merge_tropy",
+                         start=start)
+        logging.info(f"Finished Client.merge_tropy.")
+
+    def _run_stages(self,
+                    jobs: list,
+                    enrich: Callable[[list, int, dict | None], None],
+                    line_model_id: int = None,
+                    atr_model_id: int = None,
+                    journal: Journal = None,
+                    requests_per_second: float = 5.0,
+                    timeout: float = None,
+                    queue_size: int = None,
+                    on_submitted: Callable[[list, int], None] = None,
+                    ) -> None:
+        """ Submit, poll and enrich images in a pipeline of three stages connected by bounded queues.
+
+        A submitter thread submits the images (see Client._process_images), a poller thread polls every process as
+        soon as it is submitted (see the Poller class) and the calling thread enriches every row of processing data as
+        soon as its process is retired by calling enrich with the row, the position of its job and the result (None if
+        there is none). Results in Client.cache are enriched without polling. If enrich raises, no further image is
+        submitted and the exception is raised once the poller has retired the submitted processes.
+
+        :param jobs: list of (Tropy item, image index) tuples
+        :param enrich: function called with each row of processing data, the position of its job and the result
+        :param line_model_id: the Transkribus line model ID, defaults to None
+        :param atr_model_id: the Transkribus ATR model ID, defaults to None
+        :param journal: journal of submissions, defaults to None
+        :param requests_per_second: global request-rate budget while polling, defaults to 5.0
+        :param timeout: time in seconds after which unfinished processes are given up, defaults to None
+        :param queue_size: maximum number of entries of the queues between the stages, defaults to None (=
+            Client.max_in_flight)
+        :param on_submitted: function called in the submitter thread with each row of processing data and the
+            position of its job before the row is queued for enrichment, defaults to None
+        """
+
+        if queue_size is None:
+            queue_size = self.max_in_flight
+        submitted = queue.Queue(maxsize=queue_size)  # process IDs to be polled, terminated by None
+        finished = queue.Queue(maxsize=queue_size)  # process IDs to be enriched, terminated by None
+        rows = dict()  # process ID to (row of processing data, job position) tuples not enriched yet
+        results = dict()  # process ID to result of retired processes
+        lock = threading.Lock()
+        stop = threading.Event()  # set if the enrichment stage failed
 
-        for item in tropy.graph:
-            parsed_item = Item()
-            parsed_item.copy_metadata_from_dict(item)
+        def on_row(row: list, position: int) -> None:
+            if on_submitted is not None:
+                on_submitted(row, position)
+            process_id = str(row[2])
+            cached = None
+            if self.cache is not None:
+                cached = self.cache.get_result(process_id=process_id)
+            with lock:
+                new = process_id not in rows and process_id not in results
+                rows.setdefault(process_id, []).append((row, position))
+                if cached is not None:
+                    results[process_id] = cached
+                retired = process_id in results
+            if retired:
+                finished.put(process_id)
+            elif new:
+                submitted.put(process_id)
 
+        def on_retired(process_id: str, result: dict | None) -> None:
+            with lock:
+                results[process_id] = result
+            if self.cache is not None and result is not None and result.get("status") == "FINISHED":
+                self.cache.put_result(process_id=process_id,
+                                      result=result)
+            finished.put(process_id)
+
+        def submit() -> None:
             try:
-                if "atr_processed" not in parsed_item.tag:
-                    continue
-            except TypeError:
-                continue
+                self._process_images(jobs=jobs,
+                                     line_model_id=line_model_id,
+                                     atr_model_id=atr_model_id,
+                                     journal=journal,
+                                     callback=on_row,
+                                     stop=stop)
+            finally:
+                submitted.put(None)
 
+        def poll() -> None:
             try:
-                image_index = int(download[parsed_item.identifier][0])
-                text = download[parsed_item.identifier][2]["content"]["text"]  # TODO: add metadata for transcription
-                if text == "":
-                    logging.info(f"Item {parsed_item.identifier} not enriched, empty transcription.")
-                    continue
-                regions = download[parsed_item.identifier][2]["content"]["regions"]
-                parsed_item.add_note_element(text=text,
-                                             photo_index=image_index)
-                if lines is True:
-                    for region in regions:
-                        for line in region["lines"]:
-                            parsed_item.add_selection_element(text=line["text"],
-                                                              photo_index=image_index,
-                                                              coords=line["coords"]["points"])
-                item = parsed_item.serialize()
-                logging.info(f"Successfully enriched item {parsed_item.identifier}.")
-            except KeyError:
-                logging.exception(f"Item {parsed_item.identifier} has no result, previous processing or download failed.")
-                pass
-            except:
-                logging.exception(f"Unexpected exception in Client.enrich_tropy for {parsed_item.identifier}.")
-                raise
+                Poller(api=self.api,
+                       max_workers=self.max_workers,
+                       requests_per_second=requests_per_second,
+                       timeout=timeout,
+                       metrics=self.metrics).poll(process_ids=[],
+                                                  callback=on_retired,
+                                                  source=submitted)
+            finally:
+                finished.put(None)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            stages = [executor.submit(submit), executor.submit(poll)]
+            process_id = ""
+            try:
+                while (process_id := finished.get()) is not None:
+                    with lock:
+                        result, process_rows = results[process_id], rows.pop(process_id, [])
+                    for row, position in process_rows:
+                        enrich(row, position, result)
+            finally:
+                if process_id is not None:  # the enrichment stage failed, stop submitting further images
+                    stop.set()
+                while process_id is not None:  # unblock the poller stage
+                    process_id = finished.get()
+            for stage in stages:
+                stage.result()
+
+    def pipeline(self,
+                 tropy_file_path: str,
+                 tropy_save_path: str = None,
+                 mapping_save_path: str = None,
+                 item_type: str = None,
+                 item_tag: str = None,
+                 item_image_index: int = None,
+                 line_model_id: int = 49272,
+                 atr_model_id: int = 39995,
+                 lowest_common_dir: str = None,
+                 journal_path: str = None,
+                 resume: bool = False,
+                 lines: bool = False,
+                 requests_per_second: float = 5.0,
+                 timeout: float = None,
+                 queue_size: int = None,
+                 checkpoint_interval: float = None,
+                 ) -> None:
+        """ Process selected Tropy items, download and enrich them with their transcriptions in a single run.
+
+        The run is a pipeline of three stages connected by bounded queues: a submitter stage submits the selected
+        images (see Client.process_tropy), a poller stage polls every process as soon as it is submitted (see the
+        Poller class) and an enrichment stage merges every result into the Tropy export as soon as its process is
+        finished. The enriched export is saved at the end and, if a checkpoint interval is set, whenever the interval
+        has passed since the last save. The mapping is saved as well, so that Client.download and Client.enrich_tropy
+        can be run for processes which did not finish in time.
+
+        :param tropy_file_path: complete path to Tropy export file including file extension
+        :param tropy_save_path: complete path to enriched Tropy save file including file extension, defaults to None
+        :param mapping_save_path: complete path to CSV mapping save file including file extension, defaults to None
+        :param item_type: the item type, defaults to None
+        :param item_tag: the item tag, defaults to None
+        :param item_image_index: the selected item's index, defaults to None
+        :param line_model_id: the Transkribus line model ID, defaults to 49272 (= Mixed Text Line Orientation)
+        :param atr_model_id: the Transkribus ATR model ID, defaults to 39995 (= Transkribus Print M1)
+        :param lowest_common_dir: the lowest common directory, defaults to None
+        :param journal_path: complete path to JSONL journal file including file extension, defaults to None
+        :param resume: resume from the journal instead of starting a new one, defaults to False
+        :param lines: toggle line by line transcription as selection elements, defaults to False
+        :param requests_per_second: global request-rate budget while polling, defaults to 5.0
+        :param timeout: time in seconds after which unfinished processes are given up, defaults to None
+        :param queue_size: maximum number of entries of the queues between the stages, defaults to None (=
+            Client.max_in_flight)
+        :param checkpoint_interval: time in seconds between two saves of the enriched export, defaults to None (= save
+            at the end only)
+        """
+
+        logging.info(
+            f"Started Client().pipeline(tropy_file_path={tropy_file_path}, "
+            f"tropy_save_path={tropy_save_path}, "
+            f"mapping_save_path={mapping_save_path}, "
+            f"item_type={item_type}, "
+            f"item_tag={item_tag}, "
+            f"item_image_index={item_image_index}, "
+            f"line_model_id={line_model_id}, "
+            f"atr_model_id={atr_model_id}, "
+            f"lowest_common_dir={lowest_common_dir}, "
+            f"journal_path={journal_path}, "
+            f"resume={resume}, "
+            f"lines={lines}, "
+            f"requests_per_second={requests_per_second}, "
+            f"timeout={timeout}, "
+            f"queue_size={queue_size}, "
+            f"checkpoint_interval={checkpoint_interval}).")
+        start = time.perf_counter()
+        self._connect()
+
+        tropy = self._validate(tropy_file_path=tropy_file_path,
+                               tropy_save_path=tropy_save_path,
+                               mapping_save_path=mapping_save_path,
+                               item_type=item_type,
+                               item_tag=item_tag,
+                               item_image_index=item_image_index,
+                               line_model_id=line_model_id,
+                               atr_model_id=atr_model_id,
+                               lowest_common_dir=lowest_common_dir,
+                               journal_path=journal_path,
+                               resume=resume)
 
         if tropy_save_path is None:
             tropy_save_path = "".join(tropy_file_path.split(".")[:-1] + [f"_enriched_{time.strftime('%Y%m%d-%H%M%S')}.json"])
-        Utility.save_json(data=tropy.json_export,
-                          file_path=tropy_save_path)
+        jobs = []
+        deque(self._select_items(graph=tropy.get_items(item_type=item_type,
+                                                       item_tag=item_tag),
+                                 jobs=jobs,
+                                 item_image_index=item_image_index), maxlen=0)
+
+        enriched, last_checkpoint = 0, time.monotonic()
+
+        def enrich(row: list, position: int, result: dict | None) -> None:
+            nonlocal enriched, last_checkpoint
+            with self.metrics.timer("enrich_item_seconds"):
+                for item in tropy.get_items(identifier=row[0]):
+                    self._tag_item(item)
+                    self._enrich_item(item=item,
+                                      result=[[row[1], str(row[2]), result] + row[3:]],
+                                      lines=lines)
+            enriched += 1
+            if checkpoint_interval is not None and time.monotonic() - last_checkpoint > checkpoint_interval:
+                tropy.save(file_path=tropy_save_path,
+                           compact=self.compact)
+                last_checkpoint = time.monotonic()
+                logging.info(f"Checkpoint of enriched Tropy export JSON-LD file saved to {tropy_save_path} "
+                             f"({enriched} images).")
+
+        journal = None
+        if journal_path is not None:
+            journal = Journal(file_path=journal_path,
+                              resume=resume)
+        try:
+            jobs = self._resolve_paths(jobs=jobs,
+                                       lowest_common_dir=lowest_common_dir,
+                                       journal=journal)
+            self._check_quota(jobs=jobs,
+                              journal=journal)
+            self._run_stages(jobs=jobs,
+                             enrich=enrich,
+                             line_model_id=line_model_id,
+                             atr_model_id=atr_model_id,
+                             journal=journal,
+                             requests_per_second=requests_per_second,
+                             timeout=timeout,
+                             queue_size=queue_size)
+        finally:
+            if journal is not None:
+                journal.close()
+        logging.info(f"{enriched} images of {len(jobs)} queued images processed and merged.")
+        if self.cache is not None:
+            self.cache.evict()
+            self.cache.log_statistics()
+
+        if mapping_save_path is None:
+            mapping_save_path = f"mapping_{time.strftime('%Y%m%d-%H%M%S')}.csv"
+        Utility.save_csv(header=["item_id", "photo_index", "process_id", "scale"],
+                         data=self.processing_data,
+                         file_path=mapping_save_path)
+        logging.info(
+            f"Map of map of item IDs to Transkribus metagrapho API processing IDs saved to {mapping_save_path}.")
+
+        tropy.save(file_path=tropy_save_path,
+                   compact=self.compact)
         logging.info(f"Enriched Tropy export JSON-LD file saved to {tropy_save_path}.")
 
-        logging.info(f"Finished Client.enrich_tropy.")
+        self._finish_run(name="pipeline",
+                         start=start)
+        logging.info(f"Finished Client.pipeline.")
+
+    def batch(self,
+              manifest_file_path: str,
+              line_model_id: int = 49272,
+              atr_model_id: int = 39995,
+              lines: bool = False,
+              requests_per_second: float = 5.0,
+              timeout: float = None,
+              queue_size: int = None,
+              ) -> None:
+        """ Process, download and enrich several Tropy exports in a single pipelined run.
+
+        The manifest is a JSON file with a list of exports, each an object with the key "tropy_file_path" and,
+        optionally, the keys "tropy_save_path", "mapping_save_path", "item_type", "item_tag", "item_image_index" and
+        "lowest_common_dir" (see Client.pipeline). The selected images of all exports share one submission queue, one
+        poller and the authenticated session of the API wrapper, so that small exports do not each pay for startup and
+        for waiting on their slowest process. Every export gets its own mapping and enriched export, saved as soon as
+        all its images are submitted and enriched.
+
+        :param manifest_file_path: complete path to JSON manifest file including file extension
+        :param line_model_id: the Transkribus line model ID, defaults to 49272 (= Mixed Text Line Orientation)
+        :param atr_model_id: the Transkribus ATR model ID, defaults to 39995 (= Transkribus Print M1)
+        :param lines: toggle line by line transcription as selection elements, defaults to False
+        :param requests_per_second: global request-rate budget while polling, defaults to 5.0
+        :param timeout: time in seconds after which unfinished processes are given up, defaults to None
+        :param queue_size: maximum number of entries of the queues between the stages, defaults to None (=
+            Client.max_in_flight)
+        """
+
+        logging.info(
+            f"Started Client().batch(manifest_file_path={manifest_file_path}, "
+            f"line_model_id={line_model_id}, "
+            f"atr_model_id={atr_model_id}, "
+            f"lines={lines}, "
+            f"requests_per_second={requests_per_second}, "
+            f"timeout={timeout}, "
+            f"queue_size={queue_size}).")
+        start = time.perf_counter()
+
+        manifest = self._load_manifest(manifest_file_path=manifest_file_path)
+        self._connect()
+
+        exports = []  # per export: Tropy, save paths, rows by job position, jobs and rows not enriched yet
+        jobs, owners = [], []  # all jobs and the index of the export of each job
+        for index, entry in enumerate(manifest):
+            tropy = self._validate(tropy_file_path=entry["tropy_file_path"],
+                                   tropy_save_path=entry.get("tropy_save_path"),
+                                   mapping_save_path=entry.get("mapping_save_path"),
+                                   item_type=entry.get("item_type"),
+                                   item_tag=entry.get("item_tag"),
+                                   item_image_index=entry.get("item_image_index"),
+                                   line_model_id=line_model_id,
+                                   atr_model_id=atr_model_id,
+                                   lowest_common_dir=entry.get("lowest_common_dir"))
+            export_jobs = []
+            deque(self._select_items(graph=tropy.get_items(item_type=entry.get("item_type"),
+                                                           item_tag=entry.get("item_tag")),
+                                     jobs=export_jobs,
+                                     item_image_index=entry.get("item_image_index")), maxlen=0)
+            export_jobs = self._resolve_paths(jobs=export_jobs,
+                                              lowest_common_dir=entry.get("lowest_common_dir"))
+            base = "".join(entry["tropy_file_path"].split(".")[:-1])
+            timestamp = time.strftime('%Y%m%d-%H%M%S')
+            exports.append({"tropy": tropy,
+                            "tropy_save_path": entry.get("tropy_save_path") or f"{base}_enriched_{timestamp}.json",
+                            "mapping_save_path": entry.get("mapping_save_path") or f"{base}_mapping_{timestamp}.csv",
+                            "rows": dict(),
+                            "unsubmitted": len(export_jobs),
+                            "unenriched": 0,
+                            "saved": False})
+            jobs += export_jobs
+            owners += [index] * len(export_jobs)
+            logging.info(f"{len(export_jobs)} images of {entry['tropy_file_path']} queued.")
+        self._check_quota(jobs=jobs)
+
+        lock = threading.Lock()
+
+        def on_submitted(row: list, position: int) -> None:
+            with lock:
+                export = exports[owners[position]]
+                export["rows"][position] = row
+                export["unsubmitted"] -= 1
+                export["unenriched"] += 1
+
+        def save(export: dict) -> None:
+            Utility.save_csv(header=["item_id", "photo_index", "process_id", "scale"],
+                             data=[export["rows"][position] for position in sorted(export["rows"])],
+                             file_path=export["mapping_save_path"])
+            export["tropy"].save(file_path=export["tropy_save_path"],
+                                 compact=self.compact)
+            export["saved"] = True
+            logging.info(f"Map of item IDs to Transkribus metagrapho API processing IDs saved to "
+                         f"{export['mapping_save_path']}, enriched Tropy export JSON-LD file saved to "
+                         f"{export['tropy_save_path']}.")
+
+        enriched = 0
+
+        def enrich(row: list, position: int, result: dict | None) -> None:
+            nonlocal enriched
+            export = exports[owners[position]]
+            with self.metrics.timer("enrich_item_seconds"):
+                for item in export["tropy"].get_items(identifier=row[0]):
+                    self._tag_item(item)
+                    self._enrich_item(item=item,
+                                      result=[[row[1], str(row[2]), result] + row[3:]],
+                                      lines=lines)
+            enriched += 1
+            with lock:
+                export["unenriched"] -= 1
+                complete = export["unsubmitted"] == 0 and export["unenriched"] == 0
+            if complete and not export["saved"]:
+                save(export)
+
+        for export in exports:
+            if export["unsubmitted"] == 0:  # no images selected
+                save(export)
+        self._run_stages(jobs=jobs,
+                         enrich=enrich,
+                         line_model_id=line_model_id,
+                         atr_model_id=atr_model_id,
+                         requests_per_second=requests_per_second,
+                         timeout=timeout,
+                         queue_size=queue_size,
+                         on_submitted=on_submitted)
+        for export in exports:  # exports with images which were not submitted
+            if not export["saved"]:
+                save(export)
+        logging.info(f"{enriched} images of {len(jobs)} queued images of {len(exports)} exports processed and merged.")
+        if self.cache is not None:
+            self.cache.evict()
+            self.cache.log_statistics()
+
+        self._finish_run(name="batch",
+                         start=start)
+        logging.info(f"Finished Client.batch.")
@@ -0,0 +1,146 @@
+""" delta.py
+============
+Delta class. """
+
+from __future__ import annotations
+from typing import Callable, Iterable, Iterator, List
+import logging
+import re
+from metagrapho_tropy.tropy import Tropy
+from metagrapho_tropy.utility import Utility
+
+
+class Delta:
+    """ The items of a Tropy export changed by a run, saved instead of the complete export.
+
+    A delta is saved either as JSON-LD subset of the export, i.e. the export's top-level members with only the changed
+    items in its graph, which can be imported by Tropy and read by Client.enrich_tropy like any export, or as JSON
+    Patch (RFC 6902) replacing the changed items at their graph positions. Deltas are applied to the base export with
+    Delta.merge.
+
+    :param delta_format: 'jsonld' (= JSON-LD subset) or 'patch' (= JSON Patch), defaults to 'jsonld'
+    """
+
+    FORMATS = ("jsonld", "patch")
+
+    def __init__(self,
+                 delta_format: str = "jsonld") -> None:
+        if delta_format not in self.FORMATS:
+            raise ValueError(f"Delta format '{delta_format}' is not supported, use one of {self.FORMATS}.")
+        self.delta_format = delta_format
+        self.changes = []
+
+    def track(self,
+              graph: Iterable[dict],
+              changed: Callable[[dict], bool]) -> Iterator[dict]:
+        """ Yield all items of a Tropy graph, recording the changed items with their graph position.
+
+        :param graph: the Tropy items
+        :param changed: function telling whether an item was changed
+        """
+
+        for position, item in enumerate(graph):
+            if changed(item):
+                self.changes.append((position, item))
+            yield item
+
+    def save(self,
+             members: dict,
+             file_path: str,
+             compact: bool = False,
+             leading: List[str] = None) -> None:
+        """ Save the changed items.
+
+        :param members: the top-level members of the Tropy export (the "@graph" member is ignored)
+        :param file_path: complete path to file including filename and extension
+        :param compact: toggle compact JSON output, defaults to False
+        :param leading: keys of the members preceding the graph, defaults to None (= the members preceding "@graph" or
+            all members)
+        """
+
+        if self.delta_format == "patch":
+            operations = []
+            for position, item in self.changes:
+                if "identifier" in item:
+                    operations.append({"op": "test",
+                                       "path": f"/@graph/{position}/identifier",
+                                       "value": item["identifier"]})
+                operations.append({"op": "replace",
+                                   "path": f"/@graph/{position}",
+                                   "value": item})
+            Utility.save_json(data=operations,
+                              file_path=file_path,
+                              compact=compact)
+        else:
+            if leading is None:
+                keys = list(members.keys())
+                leading = keys[:keys.index("@graph")] if "@graph" in keys else keys
+            subset = {key: members[key] for key in leading}
+            subset["@graph"] = [item for _, item in self.changes]
+            subset.update((key, value) for key, value in members.items() if key not in subset)
+            Utility.save_json(data=subset,
+                              file_path=file_path,
+                              compact=compact)
+        logging.info(f"Delta of {len(self.changes)} changed items saved to {file_path}.")
+
+    @staticmethod
+    def merge(tropy_file_path: str,
+              delta_file_path: str,
+              tropy_save_path: str,
+              compact: bool = False) -> None:
+        """ Apply a delta to a Tropy export and save the merged export.
+
+        The export is streamed item by item. Items of a JSON-LD subset replace the items with the same identifier,
+        JSON Patch operations are applied by graph position; only the operations written by Delta.save are supported.
+
+        :param tropy_file_path: complete path to the base Tropy export file including file extension
+        :param delta_file_path: complete path to the delta file including file extension
+        :param tropy_save_path: complete path to merged Tropy save file including file extension
+        :param compact: toggle compact JSON output, defaults to False
+        """
+
+        delta = Utility.load_json(file_path=delta_file_path)
+        tropy = Tropy.stream(file_path=tropy_file_path)
+
+        if isinstance(delta, list):
+            tests, replacements = dict(), dict()
+            for operation in delta:
+                match = re.fullmatch(r"/@graph/(\d+)(/identifier)?", operation.get("path", ""))
+                if match is None or (operation.get("op"), match.group(2)) not in (("test", "/identifier"),
+                                                                                  ("replace", None)):
+                    raise ValueError(f"Unsupported JSON Patch operation {operation} in {delta_file_path}.")
+                target = tests if operation["op"] == "test" else replacements
+                target[int(match.group(1))] = operation["value"]
+
+            def apply(graph: Iterable[dict]) -> Iterator[dict]:
+                position = -1
+                for position, item in enumerate(graph):
+                    if position in tests and item.get("identifier") != tests[position]:
+                        raise ValueError(f"Item {position} of {tropy_file_path} is not {tests[position]}, the delta "
+                                         f"{delta_file_path} was made from another export.")
+                    yield replacements.get(position, item)
+                if max(replacements, default=-1) > position:
+                    raise ValueError(f"The delta {delta_file_path} replaces items beyond the end of "
+                                     f"{tropy_file_path}.")
+        else:
+            items = {item.get("identifier"): item for item in delta["@graph"]}
+            if None in items:
+                logging.warning(f"Items without identifier in {delta_file_path} cannot be merged.")
+                del items[None]
+            merged = set()
+
+            def apply(graph: Iterable[dict]) -> Iterator[dict]:
+                for item in graph:
+                    identifier = item.get("identifier")
+                    if identifier in items:
+                        merged.add(identifier)
+                        yield items[identifier]
+                    else:
+                        yield item
+                for identifier in items.keys() - merged:
+                    logging.warning(f"Item {identifier} of {delta_file_path} not found in {tropy_file_path}.")
+
+        tropy.graph = apply(tropy.graph)
+        tropy.save(file_path=tropy_save_path,
+                   compact=compact)
+        logging.info(f"Delta {delta_file_path} merged into {tropy_save_path}.")
@@ -3,9 +3,14 @@
 Item classes. """
 
 from __future__ import annotations
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
 from typing import List, Dict
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 @dataclass
 class Item:
@@ -100,10 +105,11 @@ class Item:
     def copy_metadata_from_dict(self, dictionary: dict) -> None:
         """ Copy metadata from dictionary. """
 
+        normalized_keys = self.get_normalized_tropy_field_names()
         try:
             for key in dictionary.keys():
                 try:
-                    normalized_key = self.get_normalized_tropy_field_names()[key]
+                    normalized_key = normalized_keys[key]
                     self.__setattr__(normalized_key, dictionary[key])
                 except KeyError:
                     pass
@@ -120,35 +126,72 @@ class Item:
         :param args: deselected attributes (values not copied)
         """
 
-        for key in item.serialize().keys():
+        serialized = item.serialize()
+        for key in serialized.keys():
             try:
                 if key in args:
                     continue
                 else:
-                    self.__setattr__(key, item.serialize()[key])
+                    self.__setattr__(key, serialized[key])
             except Exception:
                 raise
 
     @staticmethod
-    def transform_coordinates(coordinates: str) -> list[int]:
+    def transform_coordinates(coordinates: str,
+                              scale: float = 1.0) -> list[int]:
         """ Transform Transkribus coordinates points to Tropy coordinates.
 
         Sample Transkribus coordinates points: '192,458 192,514 332,514 332,458'. Read the tuple '192,
         458' as 'x, y' where '0, 0' is the top left corner of an image. Note that the y-axis is inverted (going down
-        is positive).
+        is positive). See Item.transform_coordinates_batch to transform all lines of a page at once.
 
         :param coordinates: value of Transkribus 'coords' key
+        :param scale: factor of the Tropy image to the processed image (see Preprocessor), defaults to 1.0
         """
 
-        x_coordinates = [int(c.split(",")[0]) for c in coordinates.split(" ")]
-        y_coordinates = [int(c.split(",")[1]) for c in coordinates.split(" ")]
+        return Item.transform_coordinates_batch([coordinates], scale=scale)[0]
+
+    @staticmethod
+    def transform_coordinates_batch(coordinates: List[str],
+                                    scale: float = 1.0) -> list[list[int]]:
+        """ Transform a batch of Transkribus coordinates points to Tropy coordinates (see
+        Item.transform_coordinates).
+
+        Uses NumPy arrays if NumPy is installed: all points are parsed at once and the bounding boxes are reduced per
+        line.
 
-        tropy_x = min(x_coordinates)
-        tropy_y = min(y_coordinates)
-        tropy_width = max(x_coordinates) - tropy_x
-        tropy_height = max(y_coordinates) - tropy_y
+        :param coordinates: values of Transkribus 'coords' keys
+        :param scale: factor of the Tropy image to the processed image (see Preprocessor), defaults to 1.0
+        """
 
-        return [tropy_x, tropy_y, tropy_width, tropy_height]
+        if not coordinates:
+            return []
+
+        if np is None:
+            transformed = []
+            for points in coordinates:
+                pairs = [point.split(",") for point in points.split(" ")]
+                x_coordinates = [int(pair[0]) for pair in pairs]
+                y_coordinates = [int(pair[1]) for pair in pairs]
+                if scale != 1.0:
+                    x_coordinates = [round(x * scale) for x in x_coordinates]
+                    y_coordinates = [round(y * scale) for y in y_coordinates]
+                tropy_x = min(x_coordinates)
+                tropy_y = min(y_coordinates)
+                transformed.append([tropy_x, tropy_y, max(x_coordinates) - tropy_x, max(y_coordinates) - tropy_y])
+
+            return transformed
+
+        counts = np.fromiter((points.count(" ") + 1 for points in coordinates), dtype=np.int64,
+                             count=len(coordinates))
+        points = np.array(" ".join(coordinates).replace(",", " ").split(), dtype=np.int64).reshape(-1, 2)
+        if scale != 1.0:
+            points = np.rint(points * scale).astype(np.int64)  # rounds half to even like round()
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        minima = np.minimum.reduceat(points, offsets, axis=0)
+        maxima = np.maximum.reduceat(points, offsets, axis=0)
+
+        return np.column_stack((minima, maxima - minima)).tolist()
 
     def add_note_element(self,
                          text: str,
@@ -183,6 +226,8 @@ class Item:
                               photo_index: int,
                               coords: str,
                               language: str = "de",
+                              scale: float = 1.0,
+                              box: list[int] = None,
                               ) -> None:
         """ Add a selection element with a line transcription to a photo.
 
@@ -190,6 +235,9 @@ class Item:
         :param photo_index: the photo to which the note will attach
         :param coords: Transkribus coordinates
         :param language: the note's language, defaults to 'de'
+        :param scale: factor of the Tropy image to the processed image, defaults to 1.0
+        :param box: Tropy coordinates of coords if already transformed (see Item.transform_coordinates_batch),
+            defaults to None
         """
 
         if text == "":
@@ -206,7 +254,7 @@ class Item:
                 "@language": language
             }
         }
-        line_coordinates = self.transform_coordinates(coords)
+        line_coordinates = box if box is not None else self.transform_coordinates(coords, scale=scale)
         selection_element = {
             "@type": "Selection",
             "template": "https://tropy.org/v1/templates/selection",
@@ -230,4 +278,51 @@ class Item:
         try:
             self.photo[photo_index]["selection"].append(selection_element)
         except KeyError:
-            self.photo[photo_index]["selection"] = [selection_element]
\ No newline at end of file
+            self.photo[photo_index]["selection"] = [selection_element]
+
+
+class ItemView:
+    """ A lightweight view of a Tropy item.
+
+    Unlike Item, the view does not copy the item: it wraps the item dictionary of the Tropy graph, and reading or
+    writing an Item field reads or writes the corresponding key of the dictionary (e.g. dcterms_creator is mapped to
+    'dcterms:creator'). Missing fields default to the Item defaults.
+
+    :param data: the Tropy item dictionary
+    """
+
+    __slots__ = ("data",)
+
+    # field name -> (dictionary key, default), precomputed from the Item dataclass:
+    field_table = {field.name: (field.name, field.default) for field in fields(Item)}
+    field_table.update({value: (key, None) for key, value in Item.get_normalized_tropy_field_names().items()})
+
+    transform_coordinates = staticmethod(Item.transform_coordinates)
+    add_note_element = Item.add_note_element
+    add_selection_element = Item.add_selection_element
+
+    def __init__(self,
+                 data: dict) -> None:
+        self.data = data
+
+    def __getattr__(self,
+                    name: str):
+        try:
+            key, default = ItemView.field_table[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+        return self.data.get(key, default)
+
+    def __setattr__(self,
+                    name: str,
+                    value) -> None:
+        if name == "data":
+            object.__setattr__(self, name, value)
+        else:
+            self.data[ItemView.field_table[name][0] if name in ItemView.field_table else name] = value
+
+    def serialize(self) -> dict:
+        """ Get the wrapped item dictionary (not a copy). """
+
+        return self.data
@@ -0,0 +1,115 @@
+""" journal.py
+=============
+Journal class. """
+
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+
+
+class Journal:
+    """ Append-only JSONL journal of submissions.
+
+    Every submission is written and flushed to the journal as soon as it has a process ID, so that an interrupted
+    Client.process_tropy run can be resumed without submitting completed images again.
+
+    :param file_path: complete path to the JSONL file including file extension
+    :param resume: keep the records of an existing journal, defaults to False (= start a new journal)
+    :param sync: force every record to disk with os.fsync, defaults to False
+    """
+
+    def __init__(self,
+                 file_path: str,
+                 resume: bool = False,
+                 sync: bool = False) -> None:
+        self.file_path = file_path
+        self.sync = sync
+        self.records = dict()
+        if resume:
+            self.records = self.load(file_path=file_path)
+            self.truncate(file_path=file_path)
+            logging.info(f"Resuming from journal {file_path} with {len(self.records)} submissions.")
+        self._lock = threading.Lock()
+        self._file = open(file_path, "a" if resume else "w", encoding="utf-8")
+
+    @staticmethod
+    def load(file_path: str) -> dict:
+        """ Load the records of a journal as dictionary with (item ID, image index) as key and row of processing data
+        as value. A truncated last line (e.g. after a crash) is ignored.
+
+        :param file_path: complete path to the JSONL file including file extension
+        """
+
+        records = dict()
+        try:
+            with open(file_path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning(f"Skipped invalid line in journal {file_path}.")
+                        continue
+                    records[(row[0], row[1])] = row
+        except FileNotFoundError:
+            logging.warning(f"Journal {file_path} not found, starting a new journal.")
+
+        return records
+
+    @staticmethod
+    def truncate(file_path: str) -> None:
+        """ Cut off a truncated last line (e.g. after a crash), so that the next record starts on a new line.
+
+        :param file_path: complete path to the JSONL file including file extension
+        """
+
+        try:
+            with open(file_path, "r+b") as file:
+                end = file.seek(0, os.SEEK_END)
+                position = end
+                while position > 0:
+                    start = max(0, position - 4096)
+                    file.seek(start)
+                    chunk = file.read(position - start)
+                    if position == end and chunk.endswith(b"\n"):
+                        return
+                    if b"\n" in chunk:
+                        position = start + chunk.rfind(b"\n") + 1
+                        break
+                    position = start
+                if position < end:
+                    file.truncate(position)
+                    logging.warning(f"Truncated last line of journal {file_path} removed.")
+        except FileNotFoundError:
+            pass
+
+    def get(self,
+            item_id: str,
+            item_image_index: int) -> list | None:
+        """ Get the journaled row of processing data of an image (None if it was not submitted yet).
+
+        :param item_id: the Tropy item ID
+        :param item_image_index: the image index
+        """
+
+        return self.records.get((item_id, item_image_index))
+
+    def append(self,
+               row: list) -> None:
+        """ Append a row of processing data to the journal.
+
+        :param row: item ID, image index, process ID and scale
+        """
+
+        with self._lock:
+            self.records[(row[0], row[1])] = row
+            self._file.write(json.dumps(row) + "\n")
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """ Close the journal file. """
+
+        self._file.close()
@@ -0,0 +1,158 @@
+""" metrics.py
+=============
+Metrics class. """
+
+from __future__ import annotations
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator
+import json
+import logging
+import math
+import threading
+import time
+
+
+class Metrics:
+    """ Thread-safe counters and histograms of a Client run.
+
+    Counters are incremented (e.g. bytes sent), histograms observe values (e.g. upload latency per image) in
+    cumulative buckets together with their count, sum, minimum and maximum. Every increment and observation is also
+    passed to the hooks (see Metrics.add_hook). The metrics are saved as JSON summary or in the Prometheus text
+    format (see Metrics.save).
+
+    :param prefix: prefix of the metric names in the Prometheus text format, defaults to 'metagrapho_tropy'
+    """
+
+    SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+    COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+    def __init__(self,
+                 prefix: str = "metagrapho_tropy") -> None:
+        self.prefix = prefix
+        self.counters = dict()
+        self.histograms = dict()
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self,
+                 hook: Callable[[str, float], None]) -> None:
+        """ Add a function called with metric name and value on every increment and observation.
+
+        :param hook: the function
+        """
+
+        self._hooks.append(hook)
+
+    def _notify(self,
+                name: str,
+                value: float) -> None:
+        for hook in self._hooks:
+            try:
+                hook(name, value)
+            except Exception:
+                logging.exception(f"Unexpected exception in metrics hook {hook}.")
+
+    def increment(self,
+                  name: str,
+                  value: float = 1) -> None:
+        """ Increment a counter.
+
+        :param name: the counter name
+        :param value: the increment, defaults to 1
+        """
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._notify(name, value)
+
+    def observe(self,
+                name: str,
+                value: float,
+                buckets: tuple = SECONDS_BUCKETS) -> None:
+        """ Observe a value of a histogram.
+
+        :param name: the histogram name
+        :param value: the value
+        :param buckets: upper bounds of the buckets, only used for the first observation, defaults to
+            Metrics.SECONDS_BUCKETS
+        """
+
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = {"buckets": list(buckets),
+                                                     "counts": [0] * (len(buckets) + 1),
+                                                     "count": 0,
+                                                     "sum": 0.0,
+                                                     "min": math.inf,
+                                                     "max": -math.inf}
+            histogram["counts"][bisect_left(histogram["buckets"], value)] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["min"] = min(histogram["min"], value)
+            histogram["max"] = max(histogram["max"], value)
+        self._notify(name, value)
+
+    @contextmanager
+    def timer(self,
+              name: str) -> Iterator[None]:
+        """ Observe the duration in seconds of a block.
+
+        :param name: the histogram name
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        """ Get the counters and the count, sum, mean, minimum, maximum and buckets of the histograms. """
+
+        with self._lock:
+            histograms = dict()
+            for name, histogram in self.histograms.items():
+                histograms[name] = {"count": histogram["count"],
+                                    "sum": histogram["sum"],
+                                    "mean": histogram["sum"] / histogram["count"],
+                                    "min": histogram["min"],
+                                    "max": histogram["max"],
+                                    "buckets": {str(bound): count for bound, count
+                                                in zip(histogram["buckets"] + ["+Inf"], histogram["counts"])}}
+
+            return {"counters": dict(self.counters),
+                    "histograms": histograms}
+
+    def prometheus(self) -> str:
+        """ Get the counters and histograms in the Prometheus text format, with all digits of their values. """
+
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines += [f"# TYPE {self.prefix}_{name} counter", f"{self.prefix}_{name} {value!r}"]
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {self.prefix}_{name} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram["buckets"] + ["+Inf"], histogram["counts"]):
+                    cumulative += count
+                    lines.append(f'{self.prefix}_{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines += [f"{self.prefix}_{name}_sum {histogram['sum']!r}",
+                          f"{self.prefix}_{name}_count {histogram['count']}"]
+
+        return "\n".join(lines) + "\n"
+
+    def save(self,
+             file_path: str) -> None:
+        """ Save the metrics in the Prometheus text format if the file extension is '.prom', as JSON summary otherwise.
+
+        :param file_path: complete path to file including filename and extension
+        """
+
+        with open(file_path, "w", encoding="utf-8") as file:
+            if file_path.endswith(".prom"):
+                file.write(self.prometheus())
+            else:
+                json.dump(self.summary(), file, indent=4)
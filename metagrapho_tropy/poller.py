@@ -0,0 +1,192 @@
+""" poller.py
+=============
+Poller class. """
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from metagrapho_tropy.metrics import Metrics
+from typing import TYPE_CHECKING, Callable
+import heapq
+import itertools
+import logging
+import queue
+import random
+import time
+
+if TYPE_CHECKING:
+    from metagrapho_tropy.api import TranskribusProcessingAPI
+
+
+class Poller:
+    """ Status-aware poller of Transkribus Processing API results.
+
+    The poller keeps a set of pending process IDs and polls them concurrently. A process is retired as soon as its
+    status is FINISHED or FAILED, otherwise it is polled again after an exponential backoff with jitter. A process is
+    given up without result when a poll returns an HTTP 4xx status other than 429 (e.g. an unknown or expired process
+    ID) or after max_attempts failed polls (exceptions and other HTTP statuses). All requests share a global rate
+    budget.
+
+    :param api: Transkribus metagrapho API wrapper instance
+    :param max_workers: number of concurrent requests, defaults to 4
+    :param requests_per_second: global request-rate budget, defaults to 5.0
+    :param initial_delay: delay in seconds before the second poll of a process, defaults to 2.0
+    :param max_delay: maximum delay in seconds between two polls of a process, defaults to 60.0
+    :param backoff: multiplier of the delay after each poll, defaults to 2.0
+    :param timeout: time in seconds after which pending processes are given up, defaults to None (= no timeout)
+    :param max_attempts: number of failed polls after which a process is given up, defaults to 10
+    :param metrics: metrics of polls, result sizes and bytes received, defaults to None
+    """
+
+    FINAL_STATUS = ("FINISHED", "FAILED")
+    SOURCE_INTERVAL = 0.5  # maximum time in seconds between two checks of the source queue
+
+    def __init__(self,
+                 api: TranskribusProcessingAPI,
+                 max_workers: int = 4,
+                 requests_per_second: float = 5.0,
+                 initial_delay: float = 2.0,
+                 max_delay: float = 60.0,
+                 backoff: float = 2.0,
+                 timeout: float = None,
+                 max_attempts: int = 10,
+                 metrics: Metrics = None) -> None:
+        self.api = api
+        self.max_workers = max_workers
+        self.requests_per_second = requests_per_second
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.metrics = metrics
+        self._next_slot = 0.0
+
+    def _delay(self,
+               attempts: int) -> float:
+        """ Get the delay before the next poll of a process with "equal jitter".
+
+        :param attempts: number of polls of the process so far
+        """
+
+        delay = min(self.max_delay, self.initial_delay * self.backoff ** (attempts - 1))
+
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _throttle(self) -> None:
+        """ Wait for the next free slot of the request-rate budget. """
+
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.requests_per_second
+        if slot > now:
+            time.sleep(slot - now)
+
+    def poll(self,
+             process_ids: list,
+             callback: Callable[[str, dict | None], None] = None,
+             source: queue.Queue = None) -> dict:
+        """ Poll processes until they are finished, failed, given up or timed out.
+
+        Returns a dictionary with process ID as key and the last result as value (None if no result was retrieved).
+        If a source queue is given, further process IDs are taken from it while polling until it yields None.
+
+        :param process_ids: the Transkribus Processing API "processId" parameters
+        :param callback: function called with process ID and last result as soon as a process is retired, given up or
+            timed out, defaults to None
+        :param source: queue of further process IDs terminated by None, defaults to None
+        """
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        results = dict()
+        attempts = dict()
+        failures = dict()
+        order = itertools.count()
+        schedule = []
+        in_flight = dict()
+        source_open = source is not None
+
+        def add(process_id: str) -> None:
+            if process_id not in results:
+                results[process_id] = None
+                attempts[process_id] = 0
+                failures[process_id] = 0
+                heapq.heappush(schedule, (0.0, next(order), process_id))
+
+        for process_id in process_ids:
+            add(process_id)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while schedule or in_flight or source_open:
+                while source_open:
+                    try:
+                        process_id = source.get(block=not schedule and not in_flight)
+                    except queue.Empty:
+                        break
+                    if process_id is None:
+                        source_open = False
+                    else:
+                        add(process_id)
+                if not schedule and not in_flight:
+                    continue
+                while schedule and len(in_flight) < self.max_workers and schedule[0][0] <= time.monotonic():
+                    _, _, process_id = heapq.heappop(schedule)
+                    self._throttle()
+                    in_flight[executor.submit(self.api.get_result, process_id)] = process_id
+
+                timeout = None
+                if schedule and len(in_flight) < self.max_workers:
+                    timeout = max(0.0, schedule[0][0] - time.monotonic())
+                if source_open:
+                    timeout = self.SOURCE_INTERVAL if timeout is None else min(timeout, self.SOURCE_INTERVAL)
+                if not in_flight:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    process_id = in_flight.pop(future)
+                    attempts[process_id] += 1
+                    status, rejected = None, False
+                    try:
+                        response = future.result()
+                        if self.metrics is not None:
+                            self.metrics.increment("polls")
+                            self.metrics.increment("bytes_in", len(response.content))
+                        if response.status_code == 200:
+                            results[process_id] = response.json()
+                            status = results[process_id].get("status")
+                        else:
+                            logging.warning(f"Process {process_id} returned HTTP {response.status_code}.")
+                            rejected = 400 <= response.status_code < 500 and response.status_code != 429
+                            failures[process_id] += response.status_code != 429
+                    except Exception:
+                        logging.exception(f"Unexpected exception while polling process {process_id}.")
+                        failures[process_id] += 1
+
+                    if rejected or failures[process_id] >= self.max_attempts:
+                        logging.warning(f"Process {process_id} given up after {attempts[process_id]} polls.")
+                        results[process_id] = None
+                        if self.metrics is not None:
+                            self.metrics.observe("polls_per_process", attempts[process_id], Metrics.COUNT_BUCKETS)
+                        if callback is not None:
+                            callback(process_id, None)
+                    elif status in self.FINAL_STATUS:
+                        logging.info(f"Process {process_id} retired with status {status} after "
+                                     f"{attempts[process_id]} polls.")
+                        if self.metrics is not None:
+                            self.metrics.observe("polls_per_process", attempts[process_id], Metrics.COUNT_BUCKETS)
+                            self.metrics.observe("result_bytes", len(response.content), Metrics.BYTES_BUCKETS)
+                        if callback is not None:
+                            callback(process_id, results[process_id])
+                    elif deadline is not None and time.monotonic() > deadline:
+                        logging.warning(f"Process {process_id} timed out with status {status}.")
+                        if self.metrics is not None:
+                            self.metrics.observe("polls_per_process", attempts[process_id], Metrics.COUNT_BUCKETS)
+                        if callback is not None:
+                            callback(process_id, results[process_id])
+                    else:
+                        heapq.heappush(schedule, (time.monotonic() + self._delay(attempts[process_id]),
+                                                  next(order),
+                                                  process_id))
+
+        return results
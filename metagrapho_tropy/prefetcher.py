@@ -0,0 +1,138 @@
+""" prefetcher.py
+=================
+Prefetcher class. """
+
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import mmap
+import os
+import threading
+
+
+class Prefetcher:
+    """ Bounded read-ahead of image files overlapping disk or network I/O with uploads.
+
+    The files are loaded in order by background threads while earlier images are uploaded. Loaded files count against
+    a memory ceiling until they are released; a file larger than the ceiling is only loaded when nothing else is
+    held. Files are read into memory or, with use_mmap, memory-mapped with a read-ahead advice to the kernel (suited
+    to local storage, where the page cache does the reading).
+
+    :param max_bytes: memory ceiling in bytes, defaults to 268435456 (= 256 MiB)
+    :param max_workers: number of threads loading files, defaults to 2
+    :param use_mmap: memory-map files instead of reading them, defaults to False
+    """
+
+    def __init__(self,
+                 max_bytes: int = 268435456,
+                 max_workers: int = 2,
+                 use_mmap: bool = False) -> None:
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.use_mmap = use_mmap
+        self._held = dict()
+        self._used = 0
+        self._condition = threading.Condition()
+
+    def prefetch(self,
+                 paths: list) -> list:
+        """ Start loading files in order and return a future of each file's content (None for a path of None).
+
+        Every loaded file must be released (see Prefetcher.release) and futures which are not used must be cancelled
+        (see Prefetcher.cancel), otherwise they keep holding memory.
+
+        :param paths: complete paths to the files or None
+        """
+
+        futures = [Future() for _ in paths]
+        threading.Thread(target=self._schedule,
+                         args=(paths, futures),
+                         daemon=True).start()
+
+        return futures
+
+    def _schedule(self,
+                  paths: list,
+                  futures: list) -> None:
+        """ Load files in order as long as they fit into the memory ceiling.
+
+        :param paths: complete paths to the files or None
+        :param futures: the futures of the files' content
+        """
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for path, future in zip(paths, futures):
+                try:
+                    size = 0 if path is None else os.path.getsize(path)
+                except OSError as exception:
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(exception)
+                    continue
+                with self._condition:
+                    self._condition.wait_for(lambda: future.cancelled() or self._used == 0
+                                             or self._used + size <= self.max_bytes)
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    if path is None:
+                        future.set_result(None)
+                        continue
+                    self._used += size
+                    self._held[future] = size
+                executor.submit(self._load, path, size, future)
+
+    def _load(self,
+              path: str,
+              size: int,
+              future: Future) -> None:
+        """ Load a file and set the result of its future.
+
+        :param path: complete path to the file
+        :param size: size of the file in bytes
+        :param future: the future of the file's content
+        """
+
+        try:
+            with open(path, "rb") as file:
+                if self.use_mmap and size > 0:
+                    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                    if hasattr(data, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+                        data.madvise(mmap.MADV_WILLNEED)
+                else:
+                    data = file.read()
+        except Exception as exception:
+            self._release_memory(future)
+            future.set_exception(exception)
+            return
+        logging.debug(f"Prefetched {path} ({len(data)} bytes).")
+        future.set_result(data)
+
+    def _release_memory(self,
+                        future: Future) -> None:
+        with self._condition:
+            self._used -= self._held.pop(future, 0)
+            self._condition.notify_all()
+
+    def release(self,
+                future: Future) -> None:
+        """ Release the memory of a loaded file.
+
+        :param future: the future of the file's content
+        """
+
+        if future.done() and not future.cancelled() and future.exception() is None \
+                and isinstance(future.result(), mmap.mmap):
+            future.result().close()
+        self._release_memory(future)
+
+    def cancel(self,
+               futures: list) -> None:
+        """ Cancel the files not loaded yet and release the loaded ones.
+
+        :param futures: the futures of the files' content
+        """
+
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(self.release)
+        with self._condition:
+            self._condition.notify_all()
@@ -0,0 +1,153 @@
+""" preprocessor.py
+===================
+Preprocessor class. """
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import tempfile
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class Preprocessor:
+    """ Optional downscaling and recompression of images before they are uploaded.
+
+    Images are resized to fit a maximum dimension and/or a target resolution and re-encoded to JPEG or WebP.
+    High-bit-depth greyscale images (e.g. 16-bit archival TIFFs) are normalised to 8 bits first. The preprocessing
+    runs in the calling thread or, if max_workers is set, on a process pool, which is shut down by Preprocessor.close
+    (called by Client at the end of every run). Requires Pillow.
+
+    :param max_dimension: maximum width and height in pixels, defaults to None
+    :param dpi: target resolution in DPI, only applied to images with resolution metadata, defaults to None
+    :param image_format: output format, either 'JPEG' or 'WEBP', defaults to 'JPEG'
+    :param quality: output quality, defaults to 85
+    :param max_workers: number of preprocessing processes, defaults to None (= preprocess in the calling thread)
+    :param output_dir: directory of the preprocessed images, defaults to None (= system temporary directory)
+    """
+
+    def __init__(self,
+                 max_dimension: int = None,
+                 dpi: int = None,
+                 image_format: str = "JPEG",
+                 quality: int = 85,
+                 max_workers: int = None,
+                 output_dir: str = None) -> None:
+        if Image is None:
+            logging.critical(f"Image preprocessing requires Pillow ('pip install Pillow')!")
+            raise ImportError("Pillow is not installed.")
+        try:
+            assert image_format in ("JPEG", "WEBP")
+        except AssertionError:
+            logging.critical(f"Invalid 'image_format' parameter: '{image_format}' is neither 'JPEG' nor 'WEBP'!")
+            raise
+        self.max_dimension = max_dimension
+        self.dpi = dpi
+        self.image_format = image_format
+        self.quality = quality
+        self.max_workers = max_workers
+        self.output_dir = output_dir
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_8bit(image: Image.Image) -> Image.Image:
+        """ Normalise a high-bit-depth greyscale image (modes 'I;16', 'I' and 'F') to 8 bits by stretching its range
+        of values to 0-255.
+
+        :param image: the image
+        """
+
+        if image.mode.startswith("I;16"):
+            image = image.convert("I")
+        low, high = image.getextrema()
+        if high <= low:  # uniform image
+            low, high = 0, max(high, 1)
+        factor = 255 / (high - low)
+
+        return image.point(lambda value: value * factor - low * factor).convert("L")
+
+    @staticmethod
+    def _preprocess(image_path: str,
+                    output_path: str,
+                    max_dimension: int = None,
+                    dpi: int = None,
+                    image_format: str = "JPEG",
+                    quality: int = 85) -> float:
+        """ Downscale and re-encode an image and return the scale factor of the original to the output image, the same
+        for both axes (the output size is rounded to whole pixels).
+
+        :param image_path: complete path to the original image
+        :param output_path: complete path to the output image
+        :param max_dimension: maximum width and height in pixels, defaults to None
+        :param dpi: target resolution in DPI, defaults to None
+        :param image_format: output format, defaults to 'JPEG'
+        :param quality: output quality, defaults to 85
+        """
+
+        with Image.open(image_path) as image:
+            factor = 1.0
+            if max_dimension is not None:
+                factor = min(factor, max_dimension / max(image.size))
+            if dpi is not None and "dpi" in image.info:
+                factor = min(factor, dpi / max(image.info["dpi"]))
+            size = image.size
+            if factor < 1.0:
+                size = (max(1, round(image.width * factor)), max(1, round(image.height * factor)))
+            if image.mode in ("RGB", "L"):
+                converted = image
+            elif image.mode.startswith("I") or image.mode == "F":
+                converted = Preprocessor._to_8bit(image)
+            else:
+                converted = image.convert("RGB")
+            resized = converted.resize(size, Image.LANCZOS) if size != image.size else converted
+            resized.save(output_path,
+                         format=image_format,
+                         quality=quality,
+                         exif=image.info.get("exif", b""))
+
+            return 1 / factor if size != image.size else 1.0
+
+    def preprocess(self,
+                   image_path: str) -> tuple[str, float]:
+        """ Preprocess an image and return the path to the preprocessed image and the scale factor of the original to
+        the preprocessed image. The caller is responsible for removing the preprocessed image.
+
+        :param image_path: complete path to the original image
+        """
+
+        file_descriptor, output_path = tempfile.mkstemp(suffix=f".{self.image_format.lower()}",
+                                                        dir=self.output_dir)
+        os.close(file_descriptor)
+        kwargs = dict(image_path=image_path,
+                      output_path=output_path,
+                      max_dimension=self.max_dimension,
+                      dpi=self.dpi,
+                      image_format=self.image_format,
+                      quality=self.quality)
+        try:
+            if self.max_workers is None:
+                scale = self._preprocess(**kwargs)
+            else:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                scale = self._executor.submit(self._preprocess, **kwargs).result()
+        except Exception:
+            os.remove(output_path)
+            raise
+        logging.debug(f"Image {image_path} preprocessed to {output_path} (scale {scale}).")
+
+        return output_path, scale
+
+    def close(self) -> None:
+        """ Shut down the process pool. """
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,93 @@
+""" resolver.py
+===============
+PathResolver class. """
+
+from __future__ import annotations
+from collections import defaultdict
+from typing import Iterable
+import logging
+import os
+import re
+
+
+class PathResolver:
+    """ Index of the image files below a directory resolving Tropy image paths from another machine.
+
+    The directory is scanned once and its files are indexed by basename. A Tropy image path, either POSIX or Windows,
+    is resolved to the indexed file with the same basename whose path, including the name of the directory itself,
+    shares the longest suffix of directory names with it. At least one directory name must match, since basenames
+    such as '0001.jpg' repeat in many folders; paths matching several files equally well are not resolved. Names are
+    compared case-insensitively.
+
+    :param root_dir: the lowest common directory of the image paths on this machine and in Tropy
+    """
+
+    def __init__(self,
+                 root_dir: str) -> None:
+        self.root_dir = os.path.normpath(root_dir)
+        self._root_name = os.path.basename(os.path.abspath(self.root_dir))
+        self._index = defaultdict(list)
+        files = 0
+        for directory, _, file_names in os.walk(self.root_dir):
+            relative_dir = os.path.relpath(directory, self.root_dir)
+            components = tuple() if relative_dir == os.curdir else self.split(relative_dir)
+            for file_name in file_names:
+                self._index[file_name.casefold()].append(components + (file_name,))
+                files += 1
+        logging.info(f"Indexed {files} files in {self.root_dir}.")
+
+    @staticmethod
+    def split(path: str) -> tuple:
+        """ Split a POSIX or Windows path into its components.
+
+        :param path: the path
+        """
+
+        return tuple(component for component in re.split(r"[\\/]+", path) if component not in ("", "."))
+
+    def resolve(self,
+                path: str) -> str | None:
+        """ Resolve a Tropy image path to the path of the image file on this machine (None if there is no file with
+        its basename and a matching directory name or if several files match equally well).
+
+        :param path: the Tropy image path
+        """
+
+        components = self.split(path)
+        if not components:
+            return None
+        candidates = self._index.get(components[-1].casefold())
+        if not candidates:
+            return None
+
+        def suffix_length(candidate: tuple) -> int:
+            length = 0
+            for left, right in zip(reversed((self._root_name,) + candidate), reversed(components)):
+                if left.casefold() != right.casefold():
+                    break
+                length += 1
+            return length
+
+        lengths = [suffix_length(candidate) for candidate in candidates]
+        longest = max(lengths)
+        if longest < 2:
+            logging.warning(f"No directory name of '{path}' matches the files named {components[-1]} in "
+                            f"{self.root_dir}.")
+            return None
+        best = [candidate for candidate, length in zip(candidates, lengths) if length == longest]
+        if len(best) > 1:
+            logging.warning(f"'{path}' matches {len(best)} files in {self.root_dir} equally well, e.g. "
+                            f"{os.path.join(*best[0])} and {os.path.join(*best[1])}.")
+            return None
+
+        return os.path.join(self.root_dir, *best[0])
+
+    def resolve_all(self,
+                    paths: Iterable[str]) -> dict:
+        """ Resolve Tropy image paths and return a dictionary with Tropy image path as key and the path on this
+        machine (None if it was not found) as value.
+
+        :param paths: the Tropy image paths
+        """
+
+        return {path: self.resolve(path) for path in paths}
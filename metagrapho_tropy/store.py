@@ -0,0 +1,145 @@
+""" store.py
+=============
+ResultStore class. """
+
+from __future__ import annotations
+import logging
+import sqlite3
+import threading
+
+
+class ResultStore:
+    """ SQLite store of downloaded Transkribus Processing API results, an alternative to the download JSON file.
+
+    The store has one row per image (item ID, image index, process ID and scale), one row per process (status and
+    text) and one row per line (region and line index, text and coordinates). Results are committed one by one as
+    soon as they are downloaded, so that a partial download can be used right away. The entries of an item are read
+    lazily in the format of the download JSON file (see Client._load_download), with the result reduced to the
+    fields used for enrichment.
+
+    :param file_path: complete path to the SQLite file including file extension
+    """
+
+    MAGIC = b"SQLite format 3\x00"
+
+    def __init__(self,
+                 file_path: str) -> None:
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS images ("
+                                     "item_id TEXT, "
+                                     "photo_index INTEGER, "
+                                     "process_id TEXT, "
+                                     "scale REAL, "
+                                     "PRIMARY KEY (item_id, photo_index, process_id))")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS processes ("
+                                     "process_id TEXT PRIMARY KEY, "
+                                     "status TEXT, "
+                                     "text TEXT)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS lines ("
+                                     "process_id TEXT, "
+                                     "region_index INTEGER, "
+                                     "line_index INTEGER, "
+                                     "text TEXT, "
+                                     "points TEXT, "
+                                     "PRIMARY KEY (process_id, region_index, line_index))")
+
+    @classmethod
+    def is_store(cls,
+                 file_path: str) -> bool:
+        """ Check whether a file is an SQLite file (and not a download JSON file).
+
+        :param file_path: complete path to file including filename and extension
+        """
+
+        with open(file_path, "rb") as file:
+            return file.read(len(cls.MAGIC)) == cls.MAGIC
+
+    def put_images(self,
+                   mapping: dict) -> None:
+        """ Store the images of a mapping.
+
+        :param mapping: the loaded mapping (see Client._load_mapping)
+        """
+
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)",
+                                         ((item_id, int(row[0]), str(row[1]), float(row[2]) if len(row) > 2 else 1.0)
+                                          for item_id, rows in mapping.items() for row in rows))
+
+    def put_result(self,
+                   process_id: str,
+                   result: dict | None) -> None:
+        """ Store the result of a process, replacing a previously stored result. Missing results are not stored.
+
+        :param process_id: the Transkribus Processing API "processId" parameter
+        :param result: the result
+        """
+
+        if result is None:
+            return
+        content = result.get("content") or dict()
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO processes VALUES (?, ?, ?)",
+                                     (str(process_id), result.get("status"), content.get("text")))
+            self._connection.execute("DELETE FROM lines WHERE process_id = ?", (str(process_id),))
+            self._connection.executemany("INSERT INTO lines VALUES (?, ?, ?, ?, ?)",
+                                         ((str(process_id), region_index, line_index, line["text"],
+                                           line["coords"]["points"])
+                                          for region_index, region in enumerate(content.get("regions") or [])
+                                          for line_index, line in enumerate(region["lines"])))
+        logging.debug(f"Result of process {process_id} stored in {self.file_path}.")
+
+    def _get_result(self,
+                    process_id: str) -> dict | None:
+        """ Get the stored result of a process (None if there is none).
+
+        :param process_id: the Transkribus Processing API "processId" parameter
+        """
+
+        row = self._connection.execute("SELECT status, text FROM processes WHERE process_id = ?",
+                                       (process_id,)).fetchone()
+        if row is None:
+            return None
+        result = {"status": row[0]}
+        if row[1] is not None:
+            regions = []
+            for region_index, text, points in self._connection.execute("SELECT region_index, text, points FROM lines "
+                                                                       "WHERE process_id = ? "
+                                                                       "ORDER BY region_index, line_index",
+                                                                       (process_id,)):
+                while len(regions) <= region_index:
+                    regions.append({"lines": []})
+                regions[region_index]["lines"].append({"text": text,
+                                                       "coords": {"points": points}})
+            result["content"] = {"text": row[1],
+                                 "regions": regions}
+
+        return result
+
+    def get(self,
+            item_id: str,
+            default: list = None) -> list | None:
+        """ Get the entries of image index, process ID, result and scale of an item in image order (default if the
+        item has no images).
+
+        :param item_id: the Tropy item ID
+        :param default: the value returned for items without images, defaults to None
+        """
+
+        with self._lock:
+            rows = self._connection.execute("SELECT photo_index, process_id, scale FROM images WHERE item_id = ? "
+                                            "ORDER BY photo_index, rowid",
+                                            (item_id,)).fetchall()
+            if not rows:
+                return default
+
+            return [[photo_index, process_id, self._get_result(process_id), scale]
+                    for photo_index, process_id, scale in rows]
+
+    def close(self) -> None:
+        """ Close the SQLite connection. """
+
+        self._connection.close()
@@ -3,38 +3,119 @@
  Tropy class. """
 
 from __future__ import annotations
+from collections import defaultdict
+from itertools import chain
+from typing import Iterable, List
 from metagrapho_tropy.utility import Utility
-from metagrapho_tropy.item import Item
 
 
 class Tropy:
     """ A representation of a Tropy export.
 
+    A streamed Tropy export (see Tropy.stream) holds the top-level members other than "@graph" in json_export and
+    an iterable of items in graph, which can only be consumed once.
+
+    Items of a loaded Tropy export can be looked up by identifier, type and tag. The indexes are built lazily in a
+    single pass over the graph when they are first used and reflect the graph at that time.
+
     :param json_export: loaded Tropy JSON export file
+    :param graph: iterable of items of a streamed Tropy export, defaults to None (= json_export["@graph"])
     """
 
     def __init__(self,
-                 json_export: dict) -> None:
+                 json_export: dict,
+                 graph: Iterable[dict] = None) -> None:
         self.json_export = json_export
-        self.graph = self.json_export["@graph"]
+        self.graph = self.json_export["@graph"] if graph is None else graph
+        self.streamed = graph is not None
+        self._indexes = None
+        self.leading_members = None
+
+    @classmethod
+    def stream(cls,
+               file_path: str) -> Tropy:
+        """ Stream a Tropy export from file path, yielding one item at a time.
+
+        :param file_path: complete path to file including filename and extension
+        """
+
+        members = dict()
+        graph = Utility.iter_json_graph(file_path=file_path,
+                                        members=members)
+        try:
+            first = next(graph)  # parse members preceding the graph and fail early on invalid files
+            graph = chain([first], graph)
+        except StopIteration:
+            graph = iter([])
+
+        tropy = cls(json_export=members,
+                    graph=graph)
+        tropy.leading_members = list(members.keys())
+
+        return tropy
 
     def save(self,
-             file_path) -> None:
+             file_path,
+             compact: bool = False) -> None:
         """ Save Tropy export to file path.
 
         :param file_path: complete path to file including filename and extension
+        :param compact: toggle compact JSON output, defaults to False
         """
 
-        Utility.save_json(data=self.json_export,
-                          file_path=file_path)
+        if self.streamed:
+            Utility.save_json_graph(members=self.json_export,
+                                    graph=self.graph,
+                                    file_path=file_path,
+                                    compact=compact,
+                                    leading=self.leading_members)
+        else:
+            Utility.save_json(data=self.json_export,
+                              file_path=file_path,
+                              compact=compact)
+
+    def _index(self) -> dict:
+        """ Get the indexes of item positions by identifier, type and tag, building them if necessary. """
+
+        if self.streamed:
+            raise ValueError("The items of a streamed Tropy export cannot be indexed.")
+        if self._indexes is None:
+            indexes = {"identifier": defaultdict(list),
+                       "type": defaultdict(list),
+                       "tag": defaultdict(list)}
+            for position, item in enumerate(self.graph):
+                indexes["identifier"][item.get("identifier")].append(position)
+                indexes["type"][item.get("type")].append(position)
+                for tag in item.get("tag") or []:
+                    indexes["tag"][tag].append(position)
+            self._indexes = indexes
+
+        return self._indexes
+
+    def get_items(self,
+                  identifier: str = None,
+                  item_type: str = None,
+                  item_tag: str = None) -> List[dict]:
+        """ Get the items matching all given criteria in graph order (all items if no criterion is given).
+
+        :param identifier: the item identifier, defaults to None
+        :param item_type: the item type, defaults to None
+        :param item_tag: the item tag, defaults to None
+        """
+
+        indexes = self._index()
+        positions = None
+        for key, value in (("identifier", identifier), ("type", item_type), ("tag", item_tag)):
+            if value is None:
+                continue
+            matches = indexes[key].get(value, [])
+            positions = set(matches) if positions is None else positions.intersection(matches)
+        if positions is None:
+            return list(self.graph)
+
+        return [self.graph[position] for position in sorted(positions)]
 
     def get_types(self) -> set:
         """ Get deduplicated values of the items' type fields. """
 
-        types = set()
-        for item in self.graph:
-            parsed_item = Item()
-            parsed_item.copy_metadata_from_dict(item)
-            types.add(parsed_item.type)
-
-        return types
+        return set(self._index()["type"].keys())
@@ -4,12 +4,75 @@ Utility class. """
 
 from __future__ import annotations
 import csv
-from json import load, dump
-from typing import List, Dict, Union
+import json
+from itertools import chain
+from json import JSONDecoder, JSONDecodeError
+from typing import List, Dict, Union, Iterable, Iterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
 
 
 class Utility:
-    """ A collection of utility functions. """
+    """ A collection of utility functions.
+
+    JSON files are loaded with the fastest available backend (orjson, ujson or the standard library json, see
+    Utility.set_json_backend). Pretty-printed output is always written with the standard library to keep it
+    byte-for-byte identical; compact output is written with the backend.
+    """
+
+    json_backend = "orjson" if orjson is not None else "ujson" if ujson is not None else "json"
+
+    @staticmethod
+    def set_json_backend(backend: str) -> None:
+        """ Set the JSON backend.
+
+        :param backend: 'orjson', 'ujson' or 'json'
+        """
+
+        if backend not in ("orjson", "ujson", "json") or (backend == "orjson" and orjson is None) \
+                or (backend == "ujson" and ujson is None):
+            raise ValueError(f"JSON backend '{backend}' is not available.")
+        Utility.json_backend = backend
+
+    @staticmethod
+    def loads(text: Union[str, bytes]) -> Union[List, Dict]:
+        """ Deserialize JSON with the JSON backend.
+
+        :param text: the JSON document
+        """
+
+        if Utility.json_backend == "orjson":
+            return orjson.loads(text)
+        if Utility.json_backend == "ujson":
+            return ujson.loads(text)
+
+        return json.loads(text)
+
+    @staticmethod
+    def dumps(data: Union[List, Dict],
+              compact: bool = False) -> str:
+        """ Serialize data as JSON, either pretty-printed with an indent of 4 spaces and non-ASCII characters escaped
+        (standard library) or compact without whitespace and with non-ASCII characters as UTF-8 (JSON backend).
+
+        :param data: the data to be serialized
+        :param compact: toggle compact output, defaults to False
+        """
+
+        if not compact:
+            return json.dumps(data, indent=4)
+        if Utility.json_backend == "orjson":
+            return orjson.dumps(data).decode("utf-8")
+        if Utility.json_backend == "ujson":
+            return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False)
+
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
 
     @staticmethod
     def load_json(file_path: str) -> dict:
@@ -18,22 +81,142 @@ class Utility:
         :param file_path: complete path to file including filename and extension
         """
 
-        with open(file_path, encoding="utf-8") as file:
-            loaded = load(file)
+        with open(file_path, "rb") as file:
+            loaded = Utility.loads(file.read())
 
             return loaded
 
     @staticmethod
     def save_json(data: Union[List, Dict],
-                  file_path: str) -> None:
+                  file_path: str,
+                  compact: bool = False) -> None:
         """ Save data as JSON file.
 
         :param data: the data to be saved
         :param file_path: complete path to file including filename and extension
+        :param compact: toggle compact output (see Utility.dumps), defaults to False
+        """
+
+        with open(file_path, "w", encoding="utf-8") as file:
+            if compact:
+                file.write(Utility.dumps(data, compact=True))
+            else:
+                json.dump(data, file, indent=4)
+
+    @staticmethod
+    def iter_json_graph(file_path: str,
+                        members: dict,
+                        chunk_size: int = 1048576) -> Iterator[dict]:
+        """ Incrementally parse a JSON-LD file and yield the elements of its "@graph" member one at a time.
+
+        Only the element being parsed is kept in memory. The other top-level members (e.g. "@context") are stored in
+        members as soon as they have been parsed.
+
+        :param file_path: complete path to file including filename and extension
+        :param members: dictionary to which the other top-level members are added
+        :param chunk_size: number of characters read at once, defaults to 1048576
+        """
+
+        decoder = JSONDecoder()
+        buffer, position, eof = "", 0, False
+
+        with open(file_path, encoding="utf-8") as file:
+
+            def read_more() -> None:
+                nonlocal buffer, position, eof
+                chunk = file.read(max(chunk_size, len(buffer) - position))
+                buffer, position, eof = buffer[position:] + chunk, 0, chunk == ""
+
+            def peek() -> str:
+                nonlocal position
+                while True:
+                    while position < len(buffer) and buffer[position] in " \t\n\r":
+                        position += 1
+                    if position < len(buffer) or eof:
+                        return buffer[position:position + 1]
+                    read_more()
+
+            def expect(character: str) -> None:
+                nonlocal position
+                if peek() != character:
+                    raise JSONDecodeError(f"Expecting '{character}'", buffer, position)
+                position += 1
+
+            def decode() -> Union[List, Dict, str, int, float, bool, None]:
+                nonlocal position
+                peek()
+                while True:
+                    try:
+                        value, end = decoder.raw_decode(buffer, position)
+                        if end < len(buffer) or eof:
+                            position = end
+                            return value
+                    except JSONDecodeError:
+                        if eof:
+                            raise
+                    read_more()
+
+            expect("{")
+            while peek() != "}":
+                if peek() == ",":
+                    expect(",")
+                key = decode()
+                expect(":")
+                if key != "@graph":
+                    members[key] = decode()
+                    continue
+                expect("[")
+                while peek() != "]":
+                    if peek() == ",":
+                        expect(",")
+                    yield decode()
+                expect("]")
+
+    @staticmethod
+    def save_json_graph(members: dict,
+                        graph: Iterable[dict],
+                        file_path: str,
+                        compact: bool = False,
+                        leading: List[str] = None) -> None:
+        """ Save a JSON-LD object streaming its "@graph" member from an iterable.
+
+        The output is identical to Utility.save_json of the complete object. Members added to members while the graph
+        is consumed (see Utility.iter_json_graph) are written after the graph.
+
+        :param members: the top-level members other than "@graph"
+        :param graph: the elements of the "@graph" member
+        :param file_path: complete path to file including filename and extension
+        :param compact: toggle compact output (see Utility.dumps), defaults to False
+        :param leading: keys of the members preceding the graph, defaults to None (= the members present once the
+            first element of the graph has been read)
         """
 
+        if compact:
+            indent, separator = "", ":"
+        else:
+            indent, separator = "\n    ", ": "
+        nested = indent + indent[1:]
+
+        def member(key: str, value) -> str:
+            return f"{indent}{json.dumps(key)}{separator}" + Utility.dumps(value, compact).replace("\n", indent)
+
+        graph = iter(graph)
+        first = next(graph, None)  # parse members preceding the graph
+        written = list(members.keys()) if leading is None else leading
+
         with open(file_path, "w", encoding="utf-8") as file:
-            dump(data, file, indent=4)
+            file.write("{" + "".join(f"{member(key, members[key])}," for key in written))
+            if first is None:
+                file.write(f'{indent}"@graph"{separator}[]')
+            else:
+                file.write(f'{indent}"@graph"{separator}[')
+                for i, element in enumerate(chain([first], graph)):
+                    file.write(("," if i else "") + nested + Utility.dumps(element, compact).replace("\n", nested))
+                file.write(f"{indent}]")
+            for key in members.keys():
+                if key not in written:
+                    file.write(f",{member(key, members[key])}")
+            file.write(f"{indent[:1]}}}")
 
     @staticmethod
     def load_csv(file_path: str) -> list:
@@ -0,0 +1,162 @@
+""" workqueue.py
+================
+WorkQueue class. """
+
+from __future__ import annotations
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class WorkQueue:
+    """ SQLite queue of image jobs shared by a coordinator and several worker processes or hosts.
+
+    The coordinator puts the jobs of a Client.process_tropy run into the queue together with the model IDs; workers
+    (see Client.work) claim batches of jobs with a lease, submit their images and write back their rows of processing
+    data. Jobs whose lease has expired, e.g. because their worker died, are claimed again by the next worker; the first
+    row written back for a job wins. Every claim and write is a single transaction, so that the queue can live on
+    storage shared by several hosts (the default rollback journal is used because WAL requires shared memory).
+
+    :param file_path: complete path to the SQLite file including file extension
+    :param lease_seconds: time in seconds after which claimed jobs without a row are claimed again, defaults to 600
+    :param timeout: time in seconds to wait for a lock held by another process, defaults to 60
+    """
+
+    def __init__(self,
+                 file_path: str,
+                 lease_seconds: float = 600,
+                 timeout: float = 60) -> None:
+        self.file_path = file_path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, timeout=timeout, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                                     "position INTEGER PRIMARY KEY, "
+                                     "item_id TEXT, "
+                                     "photo_index INTEGER, "
+                                     "path TEXT, "
+                                     "status TEXT, "
+                                     "claim TEXT, "
+                                     "worker TEXT, "
+                                     "lease_until REAL, "
+                                     "row TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS settings ("
+                                     "key TEXT PRIMARY KEY, "
+                                     "value TEXT)")
+
+    def put_jobs(self,
+                 jobs: list,
+                 line_model_id: int,
+                 atr_model_id: int) -> None:
+        """ Put the jobs of a run into the queue and make them available to the workers. Jobs already in the queue,
+        e.g. of an interrupted run with the same selection, are kept as they are; a queue holding the jobs of another
+        export or selection is refused, so that their rows are not merged into the mapping.
+
+        :param jobs: list of (Tropy item, image index) tuples
+        :param line_model_id: the Transkribus line model ID
+        :param atr_model_id: the Transkribus ATR model ID
+        """
+
+        def path(item, item_image_index: int) -> str | None:
+            try:
+                return item.photo[item_image_index]["path"]
+            except (IndexError, KeyError, TypeError):
+                return None
+
+        rows = [(position, item.identifier, item_image_index, path(item, item_image_index))
+                for position, (item, item_image_index) in enumerate(jobs)]
+        with self._lock, self._connection:
+            existing = self._connection.execute("SELECT position, item_id, photo_index FROM jobs "
+                                                "ORDER BY position").fetchall()
+            if existing and existing != [(position, None if item_id is None else str(item_id), item_image_index)
+                                         for position, item_id, item_image_index, _ in rows]:
+                raise ValueError(f"Work queue {self.file_path} holds the jobs of another export or selection.")
+            self._connection.executemany("INSERT OR IGNORE INTO jobs (position, item_id, photo_index, path, status) "
+                                         "VALUES (?, ?, ?, ?, 'pending')",
+                                         rows)
+            self._connection.executemany("INSERT OR REPLACE INTO settings VALUES (?, ?)",
+                                         (("line_model_id", json.dumps(line_model_id)),
+                                          ("atr_model_id", json.dumps(atr_model_id))))
+        logging.info(f"{len(jobs)} jobs put into work queue {self.file_path}.")
+
+    def get_settings(self) -> dict | None:
+        """ Get the model IDs of the run (None if the coordinator has not put the jobs into the queue yet). """
+
+        with self._lock:
+            rows = self._connection.execute("SELECT key, value FROM settings").fetchall()
+
+        return {key: json.loads(value) for key, value in rows} or None
+
+    def claim(self,
+              worker: str,
+              limit: int) -> list:
+        """ Claim pending jobs and jobs with an expired lease in queue order and return them as list of (position, item
+        ID, image index, Tropy image path) tuples.
+
+        :param worker: the name of the worker
+        :param limit: maximum number of jobs
+        """
+
+        claim, now = uuid.uuid4().hex, time.time()
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE jobs SET status = 'leased', claim = ?, worker = ?, lease_until = ? "
+                                     "WHERE position IN (SELECT position FROM jobs "
+                                     "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                                     "ORDER BY position LIMIT ?)",
+                                     (claim, worker, now + self.lease_seconds, now, limit))
+            claimed = self._connection.execute("SELECT position, item_id, photo_index, path FROM jobs "
+                                               "WHERE claim = ? ORDER BY position",
+                                               (claim,)).fetchall()
+        if claimed:
+            logging.info(f"Worker {worker} claimed {len(claimed)} jobs of work queue {self.file_path}.")
+
+        return claimed
+
+    def complete(self,
+                 position: int,
+                 row: list | None) -> None:
+        """ Write back the row of processing data of a job (None if its image is missing) unless another worker did.
+
+        :param position: the position of the job
+        :param row: the row of processing data
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE jobs SET status = 'done', row = ? WHERE position = ? AND status != 'done'",
+                                     (None if row is None else json.dumps(row), position))
+
+    def release(self,
+                positions: list) -> None:
+        """ Return claimed jobs without a row to the queue, e.g. after an error of their worker.
+
+        :param positions: the positions of the jobs
+        """
+
+        with self._lock, self._connection:
+            self._connection.executemany("UPDATE jobs SET status = 'pending', claim = NULL, worker = NULL, "
+                                         "lease_until = NULL WHERE position = ? AND status = 'leased'",
+                                         ((position,) for position in positions))
+
+    def counts(self) -> dict:
+        """ Get the number of jobs by status ('pending', 'leased' or 'done'). """
+
+        with self._lock:
+            return dict(self._connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def get_rows(self) -> list:
+        """ Get the rows of processing data of the completed jobs in queue order. """
+
+        with self._lock:
+            return [json.loads(row) for row, in self._connection.execute("SELECT row FROM jobs "
+                                                                         "WHERE status = 'done' AND row IS NOT NULL "
+                                                                         "ORDER BY position")]
+
+    def close(self) -> None:
+        """ Close the SQLite connection. """
+
+        self._connection.close()
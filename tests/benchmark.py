@@ -0,0 +1,147 @@
+""" benchmark.py
+================
+Load-test benchmark of Client against the mock Transkribus Processing API server.
+
+Run with 'python -m tests.benchmark' from the repository root, see 'python -m tests.benchmark --help' for the options.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from metagrapho_tropy.api import TranskribusProcessingAPI
+from metagrapho_tropy.client import Client
+from metagrapho_tropy.utility import Utility
+from tests.mock_server import MockProcessingServer
+
+
+def create_export(directory: str,
+                  items: int,
+                  photos_per_item: int = 1,
+                  image_size: int = 65536) -> str:
+    """ Create a synthetic Tropy export with random image files and return its path.
+
+    :param directory: the directory of the export and the images
+    :param items: number of items
+    :param photos_per_item: number of photos per item, defaults to 1
+    :param image_size: size of an image file in bytes, defaults to 65536
+    """
+
+    graph = []
+    for i in range(items):
+        photos = []
+        for j in range(photos_per_item):
+            path = os.path.join(directory, f"image_{i:06d}_{j}.jpg")
+            with open(path, "wb") as file:
+                file.write(os.urandom(image_size))
+            photos.append({"@type": "Photo", "path": path, "width": 1000, "height": 1400})
+        graph.append({"@type": "Item", "type": "Foto", "identifier": f"B{i:06d}", "photo": photos})
+    file_path = os.path.join(directory, "export.json")
+    Utility.save_json(data={"@context": {}, "@graph": graph, "version": "1.12.0"},
+                      file_path=file_path)
+
+    return file_path
+
+
+def run(server: MockProcessingServer,
+        items: int,
+        max_workers: int,
+        photos_per_item: int = 1,
+        image_size: int = 65536,
+        requests_per_second: float = 1000.0) -> dict:
+    """ Run Client.process_tropy, Client.download and Client.enrich_tropy on a synthetic export and return the
+    measurements.
+
+    :param server: the running mock server
+    :param items: number of items
+    :param max_workers: number of concurrent submissions and polls
+    :param photos_per_item: number of photos per item, defaults to 1
+    :param image_size: size of an image file in bytes, defaults to 65536
+    :param requests_per_second: request-rate budget of the API wrapper and the poller, defaults to 1000.0
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        export = create_export(directory=directory,
+                               items=items,
+                               photos_per_item=photos_per_item,
+                               image_size=image_size)
+        api = TranskribusProcessingAPI(user="benchmark",
+                                       password="benchmark",
+                                       pool_size=max_workers,
+                                       requests_per_second=requests_per_second,
+                                       base_url=server.base_url,
+                                       token_url=server.token_url)
+        client = Client(user="benchmark",
+                        password="benchmark",
+                        api=api,
+                        max_workers=max_workers)
+        images = items * photos_per_item
+
+        start = time.perf_counter()
+        client.process_tropy(tropy_file_path=export,
+                             tropy_save_path=f"{directory}/updated.json",
+                             mapping_save_path=f"{directory}/mapping.csv")
+        submit_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        client.download(mapping_file_path=f"{directory}/mapping.csv",
+                        download_save_path=f"{directory}/download.json",
+                        requests_per_second=requests_per_second)
+        download_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        client.enrich_tropy(tropy_file_path=f"{directory}/updated.json",
+                            download_file_path=f"{directory}/download.json",
+                            tropy_save_path=f"{directory}/enriched.json",
+                            lines=True)
+        enrich_time = time.perf_counter() - start
+
+    return {"items": items,
+            "images": images,
+            "max_workers": max_workers,
+            "submissions_per_second": images / submit_time,
+            "download_seconds": download_time,
+            "enriched_items_per_second": items / enrich_time}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Client against a mock Transkribus Processing API server.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="numbers of items")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16], help="numbers of concurrent workers")
+    parser.add_argument("--photos-per-item", type=int, default=1, help="number of photos per item")
+    parser.add_argument("--image-size", type=int, default=65536, help="size of an image file in bytes")
+    parser.add_argument("--latency", type=float, default=0.02, help="delay of every response in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of failing submissions")
+    parser.add_argument("--processing-delay", type=float, default=0.0, help="time until a process is finished")
+    parser.add_argument("--output", type=str, default=None, help="complete path to JSON file of the measurements")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)  # takes precedence over the log file of Client
+
+    measurements = []
+    with MockProcessingServer(latency=args.latency,
+                              failure_rate=args.failure_rate,
+                              processing_delay=args.processing_delay) as server:
+        print(f"{'items':>8} {'images':>8} {'workers':>8} {'submit/s':>10} {'download s':>11} {'enrich items/s':>15}")
+        for items in args.sizes:
+            for max_workers in args.workers:
+                measurement = run(server=server,
+                                  items=items,
+                                  max_workers=max_workers,
+                                  photos_per_item=args.photos_per_item,
+                                  image_size=args.image_size)
+                measurements.append(measurement)
+                print(f"{measurement['items']:>8} {measurement['images']:>8} {measurement['max_workers']:>8} "
+                      f"{measurement['submissions_per_second']:>10.1f} {measurement['download_seconds']:>11.2f} "
+                      f"{measurement['enriched_items_per_second']:>15.1f}")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(measurements, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+""" mock_server.py
+==================
+Mock Transkribus Processing API server. """
+
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+
+
+class _Server(ThreadingHTTPServer):
+    """ Threading HTTP server whose listen backlog holds the connections of many concurrent clients (the default of
+    5 makes further connections wait for SYN retransmits). """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MockProcessingServer:
+    """ Local stand-in for the Transkribus Processing API and its token endpoint.
+
+    The server answers POST /auth/token, POST /processes, GET /processes/{id} and GET /user. Every request is delayed
+    by latency seconds, a share of failure_rate requests to /processes fails with HTTP 503 and a process is RUNNING
+    for processing_delay seconds after its submission before it is FINISHED with a transcription of lines_per_page
+    lines.
+
+    :param latency: delay in seconds of every response, defaults to 0.0
+    :param failure_rate: share of requests to /processes failing with HTTP 503, defaults to 0.0
+    :param processing_delay: time in seconds until a process is finished, defaults to 0.0
+    :param lines_per_page: number of lines of a transcription, defaults to 20
+    :param credits: remaining credits reported by /user, defaults to 1000000
+    :param port: the port, defaults to 0 (= any free port)
+    """
+
+    def __init__(self,
+                 latency: float = 0.0,
+                 failure_rate: float = 0.0,
+                 processing_delay: float = 0.0,
+                 lines_per_page: int = 20,
+                 credits: int = 1000000,
+                 port: int = 0) -> None:
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.processing_delay = processing_delay
+        self.lines_per_page = lines_per_page
+        self.credits = credits
+        self.processes = dict()
+        self.requests = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """ Get the base URL of the server. """
+
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def base_url(self) -> str:
+        """ Get the base URL of the mocked API (see TranskribusProcessingAPI.base_url). """
+
+        return f"{self.url}/processing/v1"
+
+    @property
+    def token_url(self) -> str:
+        """ Get the URL of the mocked token endpoint (see TranskribusProcessingAPI.token_url). """
+
+        return f"{self.url}/auth/token"
+
+    def start(self) -> MockProcessingServer:
+        """ Serve requests in a background thread. """
+
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self) -> None:
+        """ Stop serving requests. """
+
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> MockProcessingServer:
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def _result(self,
+                process_id: int) -> dict:
+        """ Get the result of a process.
+
+        :param process_id: the process ID
+        """
+
+        if time.monotonic() - self.processes[process_id] < self.processing_delay:
+            return {"processId": process_id, "status": "RUNNING"}
+        lines = [{"text": f"Zeile {i} von Prozess {process_id}",
+                  "coords": {"points": f"{10 + i},{40 * i} {10 + i},{40 * i + 30} {900},{40 * i + 30} {900},{40 * i}"}}
+                 for i in range(self.lines_per_page)]
+
+        return {"processId": process_id,
+                "status": "FINISHED",
+                "content": {"text": "\n".join(line["text"] for line in lines),
+                            "regions": [{"lines": lines}]}}
+
+    def _handler(self) -> type:
+        """ Get the request handler class bound to this server. """
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self,
+                      status: int,
+                      data: dict = None,
+                      headers: dict = None) -> None:
+                body = json.dumps(data or dict()).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or dict()).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self) -> bool:
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    self._send(401, {"error": "unauthorized"})
+                    return False
+                return True
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                if self.path == "/auth/token":
+                    self._send(200, {"access_token": uuid.uuid4().hex,
+                                     "refresh_token": uuid.uuid4().hex,
+                                     "expires_in": 300})
+                elif self.path == "/processing/v1/processes":
+                    if not self._authorized():
+                        return
+                    if random.random() < server.failure_rate:
+                        self._send(503, {"error": "unavailable"})
+                        return
+                    try:
+                        json.loads(body)["image"]["base64"]
+                    except (ValueError, KeyError, TypeError):
+                        self._send(400, {"error": "invalid body"})
+                        return
+                    with server._lock:
+                        process_id = next(server._ids)
+                        server.processes[process_id] = time.monotonic()
+                    self._send(200, {"processId": process_id, "status": "CREATED"})
+                else:
+                    self._send(404)
+
+            def do_GET(self) -> None:
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                if not self._authorized():
+                    return
+                if self.path == "/processing/v1/user":
+                    self._send(200, {"userId": 1, "credits": server.credits})
+                elif self.path.startswith("/processing/v1/processes/"):
+                    try:
+                        process_id = int(self.path.split("/")[-1])
+                        assert process_id in server.processes
+                    except (ValueError, AssertionError):
+                        self._send(404, {"error": "not found"})
+                        return
+                    self._send(200, server._result(process_id))
+                else:
+                    self._send(404)
+
+        return Handler
@@ -3,14 +3,78 @@
 Unittest. """
 
 import os.path
+import requests
+import shutil
+import sqlite3
+import struct
+import tempfile
+import threading
 import unittest
+from metagrapho_tropy.api import RateLimiter, TranskribusProcessingAPI
+from metagrapho_tropy.cache import Cache
 from metagrapho_tropy.client import Client
+from metagrapho_tropy.delta import Delta
+from metagrapho_tropy.item import Item, ItemView
+from metagrapho_tropy.journal import Journal
+from metagrapho_tropy.metrics import Metrics
+from metagrapho_tropy.poller import Poller
+from metagrapho_tropy.prefetcher import Prefetcher
+from metagrapho_tropy.preprocessor import Preprocessor
+from metagrapho_tropy.resolver import PathResolver
+from metagrapho_tropy.store import ResultStore
+from metagrapho_tropy.tropy import Tropy
+from metagrapho_tropy.utility import Utility
+from metagrapho_tropy.workqueue import WorkQueue
+from tests.benchmark import create_export
+from tests.mock_server import MockProcessingServer
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 DIR = os.path.dirname(__file__)
 PARENT_DIR = os.path.dirname(os.path.dirname(__file__))
 SAMPLE = f"{PARENT_DIR}/sample"
 
 
+class TestCache(unittest.TestCase):
+    """ Test Cache class. """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_evict(self) -> None:
+        """ Test Cache.evict with max_entries and max_age. """
+
+        cache = Cache(file_path=f"{self.directory.name}/cache.sqlite",
+                      max_entries=2)
+        try:
+            for process_id in ("1", "2", "3"):
+                cache.put_submission(key=process_id,
+                                     process_id=process_id)
+            cache.put_result(process_id="3",
+                             result={"status": "FINISHED"})
+            cache.get_submission(key="1")
+            cache.evict()
+
+            self.assertEqual(("1", 1.0), cache.get_submission(key="1"))
+            self.assertIsNone(cache.get_submission(key="2"))
+            self.assertEqual({"status": "FINISHED"}, cache.get_result(process_id="3"))
+
+            cache.max_age = 0
+            cache.evict()
+            cache.max_age = 86400
+
+            self.assertIsNone(cache.get_submission(key="1"))
+            self.assertIsNone(cache.get_result(process_id="3"))
+        finally:
+            cache.close()
+
+
 class TestClient(unittest.TestCase):
     """ Test Client class. """
 
@@ -34,6 +98,790 @@ class TestClient(unittest.TestCase):
 
         self.assertEqual(enrich_gold_standard, output)
 
+    def test_load_download(self) -> None:
+        """ Test Client._load_download with download files of the current and previous versions. """
+
+        entries = [[1, "5025238", {"status": "FINISHED"}, 1.0], [2, "5025239", {"status": "FINISHED"}, 1.0]]
+        with tempfile.TemporaryDirectory() as directory:
+            Utility.save_json(data={"B0340": entries[0], "F0001": entries},
+                              file_path=f"{directory}/download.json")
+
+            self.assertEqual({"B0340": entries[:1], "F0001": entries},
+                             self.client._load_download(download_file_path=f"{directory}/download.json"))
+
+
+class TestClientMockServer(unittest.TestCase):
+    """ Test Client class against the mock Transkribus Processing API server. """
+
+    def setUp(self) -> None:
+        self.server = MockProcessingServer(processing_delay=0.5,
+                                           lines_per_page=3).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.export = create_export(directory=self.directory.name,
+                                    items=4,
+                                    photos_per_item=2,
+                                    image_size=1024)
+        self.client = Client(user="test",
+                             password="test",
+                             api=TranskribusProcessingAPI(user="test",
+                                                          password="test",
+                                                          base_url=self.server.base_url,
+                                                          token_url=self.server.token_url),
+                             max_workers=2)
+
+    def tearDown(self) -> None:
+        self.server.stop()
+        self.directory.cleanup()
+
+    def assertEnriched(self, file_path: str) -> None:
+        for item in Utility.load_json(file_path=file_path)["@graph"]:
+            self.assertIn("atr_processed", item["tag"])
+            for photo in item["photo"]:
+                self.assertEqual(1, len(photo["note"]))
+                self.assertEqual(3, len(photo["selection"]))
+
+    def test_process_download_enrich(self) -> None:
+        """ Test Client.process_tropy, Client.download and Client.enrich_tropy. """
+
+        directory = self.directory.name
+        self.client.process_tropy(tropy_file_path=self.export,
+                                  tropy_save_path=f"{directory}/updated.json",
+                                  mapping_save_path=f"{directory}/mapping.csv")
+        self.client.download(mapping_file_path=f"{directory}/mapping.csv",
+                             download_save_path=f"{directory}/download.json",
+                             requests_per_second=100)
+        self.client.enrich_tropy(tropy_file_path=f"{directory}/updated.json",
+                                 download_file_path=f"{directory}/download.json",
+                                 tropy_save_path=f"{directory}/enriched.json",
+                                 lines=True)
+
+        self.assertEqual(9, len(Utility.load_csv(file_path=f"{directory}/mapping.csv")))
+        self.assertEnriched(f"{directory}/enriched.json")
+
+    def test_poll_unknown(self) -> None:
+        """ Test Poller.poll giving up an unknown process ID. """
+
+        retired = []
+        results = Poller(api=self.client.api,
+                         requests_per_second=100).poll(process_ids=["99999"],
+                                                       callback=lambda process_id, result: retired.append(process_id))
+
+        self.assertEqual({"99999": None}, results)
+        self.assertEqual(["99999"], retired)
+
+    def test_resume(self) -> None:
+        """ Test Client.process_tropy resuming an interrupted run from its journal. """
+
+        directory = self.directory.name
+        post_processes_from_file = self.client.api.post_processes_from_file
+        calls = []
+
+        def interrupted(**kwargs):
+            calls.append(kwargs)
+            if len(calls) > 3:
+                raise ConnectionError("interrupted")
+            return post_processes_from_file(**kwargs)
+
+        self.client.api.post_processes_from_file = interrupted
+        with self.assertRaises(ConnectionError):
+            self.client.process_tropy(tropy_file_path=self.export,
+                                      tropy_save_path=f"{directory}/updated.json",
+                                      mapping_save_path=f"{directory}/mapping.csv",
+                                      journal_path=f"{directory}/journal.jsonl")
+        with open(f"{directory}/journal.jsonl", "a", encoding="utf-8") as file:
+            file.write('["B000003", 1, "9')  # crash while writing a record
+        self.client.api.post_processes_from_file = post_processes_from_file
+        for _ in range(2):
+            self.client.processing_data = []
+            self.client.process_tropy(tropy_file_path=self.export,
+                                      tropy_save_path=f"{directory}/updated.json",
+                                      mapping_save_path=f"{directory}/mapping.csv",
+                                      journal_path=f"{directory}/journal.jsonl",
+                                      resume=True)
+
+        self.assertEqual(8, len(self.server.processes))
+        self.assertEqual(8, len(Journal.load(file_path=f"{directory}/journal.jsonl")))
+        self.assertEqual(9, len(Utility.load_csv(file_path=f"{directory}/mapping.csv")))
+
+    def test_rejected(self) -> None:
+        """ Test Client.process_tropy skipping images rejected by the API and saving the mapping of the images
+        submitted before an error. """
+
+        directory = self.directory.name
+        post_processes_from_file = self.client.api.post_processes_from_file
+
+        def rejecting(**kwargs):
+            if kwargs["image_path"].endswith("image_000001_0.jpg"):
+                response = requests.Response()
+                response.status_code = 413
+                return response
+            if kwargs["image_path"].endswith("image_000003_1.jpg"):
+                raise ConnectionError("interrupted")
+            return post_processes_from_file(**kwargs)
+
+        self.client.api.post_processes_from_file = rejecting
+        with self.assertRaises(ConnectionError):
+            self.client.process_tropy(tropy_file_path=self.export,
+                                      tropy_save_path=f"{directory}/updated.json",
+                                      mapping_save_path=f"{directory}/mapping.csv")
+
+        self.assertEqual(6, len(self.server.processes))
+        self.assertEqual(7, len(Utility.load_csv(file_path=f"{directory}/mapping.csv")))
+        self.assertFalse(os.path.exists(f"{directory}/updated.json"))
+
+    def test_missing_image(self) -> None:
+        """ Test Client.process_tropy leaving items without any submitted image untagged. """
+
+        directory = self.directory.name
+        os.remove(f"{directory}/image_000001_0.jpg")
+        os.remove(f"{directory}/image_000001_1.jpg")
+        os.remove(f"{directory}/image_000002_1.jpg")
+        for stream in (False, True):
+            self.client.processing_data = []
+            self.client.process_tropy(tropy_file_path=self.export,
+                                      tropy_save_path=f"{directory}/updated_{stream}.json",
+                                      mapping_save_path=f"{directory}/mapping_{stream}.csv",
+                                      stream=stream)
+            tags = {item["identifier"]: item.get("tag", [])
+                    for item in Utility.load_json(file_path=f"{directory}/updated_{stream}.json")["@graph"]}
+
+            self.assertEqual(6, len(Utility.load_csv(file_path=f"{directory}/mapping_{stream}.csv")))
+            self.assertEqual({"B000000": ["atr_processed"], "B000001": [], "B000002": ["atr_processed"],
+                              "B000003": ["atr_processed"]}, tags)
+
+    def test_quota(self) -> None:
+        """ Test Client.process_tropy refusing a batch exceeding the remaining credits without saving anything. """
+
+        directory = self.directory.name
+        self.server.credits = 2
+        for options in ({"stream": True}, {"delta_format": "jsonld"}, {"stream": True, "delta_format": "patch"}):
+            with self.assertRaises(ValueError):
+                self.client.process_tropy(tropy_file_path=self.export,
+                                          tropy_save_path=f"{directory}/updated.json",
+                                          mapping_save_path=f"{directory}/mapping.csv",
+                                          **options)
+
+            self.assertEqual(0, len(self.server.processes))
+            self.assertFalse(os.path.exists(f"{directory}/updated.json"))
+            self.assertFalse(os.path.exists(f"{directory}/mapping.csv"))
+
+    def test_retry(self) -> None:
+        """ Test TranskribusProcessingAPI retrying HTTP 5xx through the rate limiter. """
+
+        image_path = f"{self.directory.name}/image_000000_0.jpg"
+        api = self.client.api
+        self.server.failure_rate = 1.0
+        response = api.post_processes_from_file(line_model_id=1,
+                                                atr_model_id=2,
+                                                image_path=image_path)
+
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(api.max_retries + 1, self.client.metrics.counters["http_503_responses"])
+        self.assertEqual(10.0 * 0.5 ** (api.max_retries + 1), api.limiter.rate)
+
+        def recover(name: str, value: float) -> None:
+            if name == "http_503_responses" and self.client.metrics.counters[name] >= api.max_retries + 3:
+                self.server.failure_rate = 0.0
+
+        self.client.metrics.add_hook(recover)
+        response = api.post_processes_from_file(line_model_id=1,
+                                                atr_model_id=2,
+                                                image_path=image_path)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(self.server.processes))
+
+    def test_cache(self) -> None:
+        """ Test Client.process_tropy and Client.download with Client.cache deduplicating images and results. """
+
+        directory = self.directory.name
+        shutil.copyfile(f"{directory}/image_000000_0.jpg", f"{directory}/image_000001_0.jpg")
+        self.client.cache = Cache(file_path=f"{directory}/cache.sqlite")
+        try:
+            for _ in range(2):
+                self.client.processing_data = []
+                self.client.process_tropy(tropy_file_path=self.export,
+                                          tropy_save_path=f"{directory}/updated.json",
+                                          mapping_save_path=f"{directory}/mapping.csv")
+            mapping = Utility.load_csv(file_path=f"{directory}/mapping.csv")[1:]
+            process_ids = {(row[0], int(row[1])): row[2] for row in mapping}
+
+            self.assertEqual(7, len(self.server.processes))
+            self.assertEqual(process_ids[("B000000", 0)], process_ids[("B000001", 0)])
+
+            self.client.download(mapping_file_path=f"{directory}/mapping.csv",
+                                 download_save_path=f"{directory}/download.json",
+                                 requests_per_second=100)
+            requests, hits = self.server.requests, self.client.cache.hits
+            self.client.download(mapping_file_path=f"{directory}/mapping.csv",
+                                 download_save_path=f"{directory}/download_cached.json",
+                                 requests_per_second=100)
+
+            self.assertEqual(requests, self.server.requests)
+            self.assertEqual(hits + 7, self.client.cache.hits)
+            self.assertEqual(Utility.load_json(file_path=f"{directory}/download.json"),
+                             Utility.load_json(file_path=f"{directory}/download_cached.json"))
+        finally:
+            self.client.cache.close()
+
+    def test_delta(self) -> None:
+        """ Test Client.process_tropy and Client.enrich_tropy saving deltas and Client.merge_tropy. """
+
+        directory = self.directory.name
+        self.client.process_tropy(tropy_file_path=self.export,
+                                  tropy_save_path=f"{directory}/updated.json",
+                                  mapping_save_path=f"{directory}/mapping.csv",
+                                  delta_format="jsonld")
+        self.client.download(mapping_file_path=f"{directory}/mapping.csv",
+                             download_save_path=f"{directory}/download.json",
+                             requests_per_second=100)
+        self.client.enrich_tropy(tropy_file_path=self.export,
+                                 download_file_path=f"{directory}/download.json",
+                                 tropy_save_path=f"{directory}/enriched_empty.json",
+                                 delta_format="patch")
+        self.client.enrich_tropy(tropy_file_path=f"{directory}/updated.json",
+                                 download_file_path=f"{directory}/download.json",
+                                 tropy_save_path=f"{directory}/enriched.json",
+                                 lines=True,
+                                 delta_format="jsonld")
+        self.client.merge_tropy(tropy_file_path=self.export,
+                                delta_file_path=f"{directory}/enriched.json",
+                                tropy_save_path=f"{directory}/merged.json")
+
+        self.assertEqual([], Utility.load_json(file_path=f"{directory}/enriched_empty.json"))  # nothing tagged
+        self.assertEqual(4, len(Utility.load_json(file_path=f"{directory}/updated.json")["@graph"]))
+        self.assertEnriched(f"{directory}/merged.json")
+
+    def test_pipeline_failure(self) -> None:
+        """ Test Client.pipeline stopping the submissions if the enrichment fails. """
+
+        directory = self.directory.name
+        self.server.latency, self.server.processing_delay = 0.02, 0.0
+        os.makedirs(f"{directory}/large")
+        export = create_export(directory=f"{directory}/large",
+                               items=50,
+                               image_size=1024)
+
+        def failing(**kwargs):
+            raise RuntimeError("enrichment failed")
+
+        self.client._enrich_item = failing
+        with self.assertRaises(RuntimeError):
+            self.client.pipeline(tropy_file_path=export,
+                                 tropy_save_path=f"{directory}/enriched.json",
+                                 mapping_save_path=f"{directory}/mapping.csv",
+                                 requests_per_second=100)
+
+        self.assertLess(len(self.server.processes), 50)
+
+    def test_batch(self) -> None:
+        """ Test Client.batch with two exports sharing item IDs. """
+
+        directory = self.directory.name
+        manifest = [{"tropy_file_path": self.export,
+                     "tropy_save_path": f"{directory}/enriched_0.json",
+                     "mapping_save_path": f"{directory}/mapping_0.csv"}]
+        os.makedirs(f"{directory}/other")
+        manifest.append({"tropy_file_path": create_export(directory=f"{directory}/other",
+                                                          items=2,
+                                                          image_size=1024),
+                         "tropy_save_path": f"{directory}/enriched_1.json",
+                         "mapping_save_path": f"{directory}/mapping_1.csv"})
+        Utility.save_json(data=manifest,
+                          file_path=f"{directory}/manifest.json")
+        self.client.batch(manifest_file_path=f"{directory}/manifest.json",
+                          lines=True,
+                          requests_per_second=100)
+
+        self.assertEqual(9, len(Utility.load_csv(file_path=f"{directory}/mapping_0.csv")))
+        self.assertEqual(3, len(Utility.load_csv(file_path=f"{directory}/mapping_1.csv")))
+        self.assertEnriched(f"{directory}/enriched_0.json")
+        self.assertEnriched(f"{directory}/enriched_1.json")
+
+    def test_work(self) -> None:
+        """ Test Client.process_tropy with a work queue shared with a worker. """
+
+        directory = self.directory.name
+        worker = Client(user="test",
+                        password="test",
+                        api=self.client.api,
+                        max_workers=1,
+                        max_in_flight=1)
+        thread = threading.Thread(target=worker.work,
+                                  kwargs={"work_queue_path": f"{directory}/queue.sqlite",
+                                          "worker": "worker",
+                                          "poll_interval": 0.1})
+        thread.start()
+        self.client.process_tropy(tropy_file_path=self.export,
+                                  tropy_save_path=f"{directory}/updated.json",
+                                  mapping_save_path=f"{directory}/mapping.csv",
+                                  work_queue_path=f"{directory}/queue.sqlite")
+        thread.join(timeout=30)
+
+        mapping = Utility.load_csv(file_path=f"{directory}/mapping.csv")
+        self.assertEqual(9, len(mapping))
+        self.assertEqual(8, len({row[2] for row in mapping[1:]}))
+        self.assertEqual([f"B{i // 2:06d}" for i in range(8)], [row[0] for row in mapping[1:]])
+
+    def test_work_failure(self) -> None:
+        """ Test Client.work returning a job to the queue if its row cannot be written back. """
+
+        directory = self.directory.name
+        complete, failed = WorkQueue.complete, []
+
+        def failing(work_queue, position, row):
+            if row is not None and not failed:
+                failed.append(position)
+                raise sqlite3.OperationalError("database is locked")
+            complete(work_queue, position=position, row=row)
+
+        WorkQueue.complete = failing
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                self.client.process_tropy(tropy_file_path=self.export,
+                                          tropy_save_path=f"{directory}/updated.json",
+                                          mapping_save_path=f"{directory}/mapping.csv",
+                                          work_queue_path=f"{directory}/queue.sqlite")
+        finally:
+            WorkQueue.complete = complete
+        work_queue = WorkQueue(file_path=f"{directory}/queue.sqlite")
+        try:
+            counts = work_queue.counts()
+
+            self.assertNotIn("leased", counts)
+            self.assertEqual(len(work_queue.get_rows()), counts.get("done", 0))
+            self.assertLess(counts.get("done", 0), 8)
+        finally:
+            work_queue.close()
+
+        self.client.processing_data = []
+        self.client.process_tropy(tropy_file_path=self.export,
+                                  tropy_save_path=f"{directory}/updated.json",
+                                  mapping_save_path=f"{directory}/mapping.csv",
+                                  work_queue_path=f"{directory}/queue.sqlite")
+
+        self.assertEqual(9, len(Utility.load_csv(file_path=f"{directory}/mapping.csv")))
+
+    def test_enrich_parallel(self) -> None:
+        """ Test Client.enrich_tropy with max_processes against the serial enrichment. """
+
+        directory = self.directory.name
+        self.client.process_tropy(tropy_file_path=self.export,
+                                  tropy_save_path=f"{directory}/updated.json",
+                                  mapping_save_path=f"{directory}/mapping.csv")
+        self.client.download(mapping_file_path=f"{directory}/mapping.csv",
+                             download_save_path=f"{directory}/download.json",
+                             requests_per_second=100)
+        for name, options in (("serial", {}),
+                              ("parallel", {"max_processes": 2}),
+                              ("streamed", {"max_processes": 2, "stream": True})):
+            self.client.enrich_tropy(tropy_file_path=f"{directory}/updated.json",
+                                     download_file_path=f"{directory}/download.json",
+                                     tropy_save_path=f"{directory}/enriched_{name}.json",
+                                     lines=True,
+                                     **options)
+
+        with open(f"{directory}/enriched_serial.json", "rb") as file:
+            serial = file.read()
+        for name in ("parallel", "streamed"):
+            with open(f"{directory}/enriched_{name}.json", "rb") as file:
+                self.assertEqual(serial, file.read())
+
+    @unittest.skipIf(Image is None, "requires Pillow")
+    def test_preprocessor_scale(self) -> None:
+        """ Test the scale of preprocessed images through Client.process_tropy, Client.download and
+        Client.enrich_tropy. """
+
+        directory = self.directory.name
+        for item in Utility.load_json(file_path=self.export)["@graph"]:
+            for photo in item["photo"]:
+                Image.new("L", (1000, 1400), 128).save(photo["path"], format="PNG")
+        self.client.preprocessor = Preprocessor(max_dimension=700,
+                                                max_workers=2)
+        self.client.process_tropy(tropy_file_path=self.export,
+                                  tropy_save_path=f"{directory}/updated.json",
+                                  mapping_save_path=f"{directory}/mapping.csv")
+        self.client.download(mapping_file_path=f"{directory}/mapping.csv",
+                             download_save_path=f"{directory}/download.json",
+                             requests_per_second=100)
+        self.client.enrich_tropy(tropy_file_path=f"{directory}/updated.json",
+                                 download_file_path=f"{directory}/download.json",
+                                 tropy_save_path=f"{directory}/enriched.json",
+                                 lines=True)
+
+        self.assertEqual({"2.0"}, {row[3] for row in Utility.load_csv(file_path=f"{directory}/mapping.csv")[1:]})
+        self.assertIsNone(self.client.preprocessor._executor)
+        selection = Utility.load_json(file_path=f"{directory}/enriched.json")["@graph"][0]["photo"][0]["selection"][0]
+        self.assertEqual((20, 0, 1780, 60),
+                         (selection["x"], selection["y"], selection["width"], selection["height"]))
+
+    def test_pipeline(self) -> None:
+        """ Test Client.pipeline. """
+
+        directory = self.directory.name
+        self.client.prefetcher = Prefetcher(max_bytes=2048)
+        self.client.pipeline(tropy_file_path=self.export,
+                             tropy_save_path=f"{directory}/enriched.json",
+                             mapping_save_path=f"{directory}/mapping.csv",
+                             lines=True,
+                             requests_per_second=100)
+
+        self.assertEqual(9, len(Utility.load_csv(file_path=f"{directory}/mapping.csv")))
+        self.assertEnriched(f"{directory}/enriched.json")
+        summary = self.client.metrics.summary()
+        self.assertEqual(8, summary["histograms"]["upload_seconds"]["count"])
+        self.assertEqual(8, summary["histograms"]["enrich_item_seconds"]["count"])
+        self.assertLess(8 * 1024, summary["counters"]["bytes_out"])
+
+
+class TestMetrics(unittest.TestCase):
+    """ Test Metrics class. """
+
+    def test_metrics(self) -> None:
+        """ Test Metrics.increment, Metrics.observe, Metrics.summary and Metrics.prometheus. """
+
+        metrics = Metrics()
+        observed = []
+        metrics.add_hook(lambda name, value: observed.append((name, value)))
+        metrics.increment("bytes_out", 100)
+        metrics.increment("bytes_out", 50)
+        metrics.observe("polls_per_process", 1, Metrics.COUNT_BUCKETS)
+        metrics.observe("polls_per_process", 4, Metrics.COUNT_BUCKETS)
+        summary = metrics.summary()
+
+        self.assertEqual(150, summary["counters"]["bytes_out"])
+        self.assertEqual({"count": 2, "sum": 5.0, "mean": 2.5, "min": 1, "max": 4},
+                         {key: value for key, value in summary["histograms"]["polls_per_process"].items()
+                          if key != "buckets"})
+        self.assertEqual(4, len(observed))
+        self.assertIn('metagrapho_tropy_polls_per_process_bucket{le="5"} 2', metrics.prometheus())
+        self.assertIn("metagrapho_tropy_bytes_out 150", metrics.prometheus())
+        metrics.increment("bytes_out", 2147495843)
+        metrics.observe("upload_seconds", 1234567.891)
+        self.assertIn("metagrapho_tropy_bytes_out 2147495993", metrics.prometheus())
+        self.assertIn("metagrapho_tropy_upload_seconds_sum 1234567.891", metrics.prometheus())
+
+
+class TestDelta(unittest.TestCase):
+    """ Test Delta class. """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.export = {"@context": {}, "@graph": [{"identifier": "A", "tag": []}, {"identifier": "B", "tag": []}],
+                       "version": "1.12.0"}
+        Utility.save_json(data=self.export,
+                          file_path=f"{self.directory.name}/export.json")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_merge(self) -> None:
+        """ Test Delta.save and Delta.merge with both formats. """
+
+        directory = self.directory.name
+        for delta_format in Delta.FORMATS:
+            delta = Delta(delta_format=delta_format)
+            graph = [{"identifier": "A", "tag": []}, {"identifier": "B", "tag": ["atr_processed"]}]
+            list(delta.track(graph=graph,
+                             changed=lambda item: "atr_processed" in item["tag"]))
+            delta.save(members=self.export,
+                       file_path=f"{directory}/delta.json")
+            Delta.merge(tropy_file_path=f"{directory}/export.json",
+                        delta_file_path=f"{directory}/delta.json",
+                        tropy_save_path=f"{directory}/merged.json")
+
+            self.assertEqual({**self.export, "@graph": graph},
+                             Utility.load_json(file_path=f"{directory}/merged.json"))
+
+        Utility.save_json(data={**self.export, "@graph": [{"identifier": "B"}]},
+                          file_path=f"{directory}/export.json")
+        with self.assertRaises(ValueError):
+            Delta.merge(tropy_file_path=f"{directory}/export.json",
+                        delta_file_path=f"{directory}/delta.json",
+                        tropy_save_path=f"{directory}/merged.json")
+
+
+class TestItem(unittest.TestCase):
+    """ Test Item and ItemView classes. """
+
+    def setUp(self) -> None:
+        self.data = Utility.load_json(file_path=f"{DIR}/input/export.json")["@graph"][0]
+
+    def test_item_view(self) -> None:
+        """ Test ItemView against Item. """
+
+        item = Item()
+        item.copy_metadata_from_dict(self.data)
+        view = ItemView(self.data)
+
+        for field in ItemView.field_table:
+            self.assertEqual(getattr(item, field), getattr(view, field))
+        view.dcterms_creator = "Johannes Schäfer"
+        self.assertEqual("Johannes Schäfer", self.data["dcterms:creator"])
+        self.assertIs(self.data, view.serialize())
+
+    def test_transform_coordinates(self) -> None:
+        """ Test Item.transform_coordinates and Item.transform_coordinates_batch. """
+
+        coordinates = ["192,458 192,514 332,514 332,458", "10,20", "5,7 3,9"]
+
+        self.assertEqual([192, 458, 140, 56], Item.transform_coordinates(coordinates[0]))
+        self.assertEqual([[192, 458, 140, 56], [10, 20, 0, 0], [3, 7, 2, 2]],
+                         Item.transform_coordinates_batch(coordinates))
+        self.assertEqual([[384, 916, 280, 112], [20, 40, 0, 0], [6, 14, 4, 4]],
+                         Item.transform_coordinates_batch(coordinates, scale=2.0))
+
+
+class TestPathResolver(unittest.TestCase):
+    """ Test PathResolver class. """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        for path in ("WE 1/Images/0001.jpg", "WE 1/Images/0002.jpg", "WE 2/Images/0001.jpg"):
+            os.makedirs(os.path.dirname(f"{self.directory.name}/{path}"), exist_ok=True)
+            open(f"{self.directory.name}/{path}", "wb").close()
+        self.resolver = PathResolver(root_dir=self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_resolve(self) -> None:
+        """ Test PathResolver.resolve with Windows and POSIX paths. """
+
+        root = self.directory.name
+
+        self.assertEqual(os.path.join(root, "WE 2", "Images", "0001.jpg"),
+                         self.resolver.resolve("C:\\Users\\digitized\\WE 2\\Images\\0001.jpg"))
+        self.assertEqual(os.path.join(root, "WE 1", "Images", "0001.jpg"),
+                         self.resolver.resolve("/home/user/digitized/we 1/images/0001.JPG"))
+        self.assertEqual(os.path.join(root, "WE 1", "Images", "0002.jpg"),
+                         self.resolver.resolve(f"D:\\{os.path.basename(root)}\\WE 1\\Images\\0002.jpg"))
+        self.assertIsNone(self.resolver.resolve("D:\\0002.jpg"))
+        self.assertIsNone(self.resolver.resolve("C:\\Users\\digitized\\Other\\0001.jpg"))
+        self.assertIsNone(self.resolver.resolve("C:\\Users\\digitized\\Images\\0001.jpg"))  # tie
+        self.assertIsNone(self.resolver.resolve("C:\\Users\\digitized\\WE 2\\Images\\0003.jpg"))
+
+
+class TestPrefetcher(unittest.TestCase):
+    """ Test Prefetcher class. """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(4):
+            self.paths.append(f"{self.directory.name}/{i}.jpg")
+            with open(self.paths[-1], "wb") as file:
+                file.write(bytes([i]) * 1024)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_prefetch(self) -> None:
+        """ Test Prefetcher.prefetch and Prefetcher.release within the memory ceiling. """
+
+        for use_mmap in (False, True):
+            prefetcher = Prefetcher(max_bytes=2048,
+                                    use_mmap=use_mmap)
+            futures = prefetcher.prefetch(paths=self.paths + [None])
+            for i, future in enumerate(futures[:4]):
+                self.assertEqual(bytes([i]) * 1024, bytes(future.result(timeout=5)))
+                self.assertLessEqual(prefetcher._used, 2048)
+                prefetcher.release(future)
+            self.assertIsNone(futures[4].result(timeout=5))
+            self.assertEqual(0, prefetcher._used)
+
+
+class TestWorkQueue(unittest.TestCase):
+    """ Test WorkQueue class. """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.work_queue = WorkQueue(file_path=f"{self.directory.name}/queue.sqlite",
+                                    lease_seconds=0)
+
+    def tearDown(self) -> None:
+        self.work_queue.close()
+        self.directory.cleanup()
+
+    def test_claim(self) -> None:
+        """ Test WorkQueue.claim with expired leases and WorkQueue.complete. """
+
+        jobs = [(ItemView({"identifier": "A", "photo": [{"path": "a.jpg"}]}), 0),
+                (ItemView({"identifier": "B"}), 0)]
+        self.assertIsNone(self.work_queue.get_settings())
+        self.work_queue.put_jobs(jobs=jobs,
+                                 line_model_id=1,
+                                 atr_model_id=2)
+
+        self.assertEqual({"line_model_id": 1, "atr_model_id": 2}, self.work_queue.get_settings())
+        self.assertEqual([(0, "A", 0, "a.jpg")], self.work_queue.claim(worker="first", limit=1))
+        self.assertEqual([(0, "A", 0, "a.jpg"), (1, "B", 0, None)], self.work_queue.claim(worker="second", limit=2))
+        self.work_queue.complete(position=0, row=["A", 0, "1", 1.0])
+        self.work_queue.complete(position=0, row=["A", 0, "2", 1.0])
+        self.work_queue.complete(position=1, row=None)
+        self.assertEqual([["A", 0, "1", 1.0]], self.work_queue.get_rows())
+        self.assertEqual({"done": 2}, self.work_queue.counts())
+
+    def test_put_jobs(self) -> None:
+        """ Test WorkQueue.put_jobs refusing the jobs of another selection. """
+
+        jobs = [(ItemView({"identifier": "A", "photo": [{"path": "a.jpg"}, {"path": "b.jpg"}]}), 0),
+                (ItemView({"identifier": "A", "photo": [{"path": "a.jpg"}, {"path": "b.jpg"}]}), 1)]
+        self.work_queue.put_jobs(jobs=jobs,
+                                 line_model_id=1,
+                                 atr_model_id=2)
+        self.work_queue.put_jobs(jobs=jobs,
+                                 line_model_id=1,
+                                 atr_model_id=2)
+
+        self.assertEqual({"pending": 2}, self.work_queue.counts())
+        with self.assertRaises(ValueError):
+            self.work_queue.put_jobs(jobs=jobs[1:],
+                                     line_model_id=1,
+                                     atr_model_id=2)
+
+
+@unittest.skipIf(Image is None, "requires Pillow")
+class TestPreprocessor(unittest.TestCase):
+    """ Test Preprocessor class. """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_preprocess(self) -> None:
+        """ Test Preprocessor.preprocess with a 16-bit greyscale TIFF. """
+
+        image_path = f"{self.directory.name}/16bit.tif"
+        data = b"".join(struct.pack("<H", x * 257) for _ in range(10) for x in range(256))
+        Image.frombytes("I;16", (256, 10), data).save(image_path, format="TIFF")
+
+        output_path, scale = Preprocessor(max_dimension=128,
+                                          output_dir=self.directory.name).preprocess(image_path=image_path)
+
+        self.assertEqual(2.0, scale)
+        with Image.open(output_path) as image:
+            self.assertEqual(("L", (128, 5)), (image.mode, image.size))
+            self.assertLess(abs(image.getpixel((64, 2)) - 128), 8)
+            self.assertLess(image.getpixel((2, 2)), 8)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """ Test RateLimiter class. """
+
+    def test_update(self) -> None:
+        """ Test RateLimiter.update and RateLimiter.parse_retry_after. """
+
+        limiter = RateLimiter(max_rate=4.0,
+                              min_rate=1.0,
+                              increase=0.5)
+        limiter.update(status_code=429)
+        self.assertEqual(2.0, limiter.rate)
+        limiter.update(status_code=503)
+        limiter.update(status_code=429)
+        self.assertEqual(1.0, limiter.rate)
+        limiter.update(status_code=200)
+        self.assertEqual(1.5, limiter.rate)
+        self.assertEqual(120.0, RateLimiter.parse_retry_after("120"))
+        self.assertEqual(0.0, RateLimiter.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+        self.assertIsNone(RateLimiter.parse_retry_after("soon"))
+
+
+class TestResultStore(unittest.TestCase):
+    """ Test ResultStore class. """
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ResultStore(file_path=f"{self.directory.name}/output.sqlite")
+
+    def tearDown(self) -> None:
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_get(self) -> None:
+        """ Test ResultStore.get with finished and missing results. """
+
+        result = {"status": "FINISHED",
+                  "content": {"text": "Basel\nRhein",
+                              "regions": [{"lines": [{"text": "Basel", "coords": {"points": "1,2 3,4"}}]},
+                                          {"lines": [{"text": "Rhein", "coords": {"points": "5,6 7,8"}}]}]}}
+        self.store.put_images(mapping={"F0001": [["2", "5025240", "0.5"], ["1", "5025239"]]})
+        self.store.put_result(process_id="5025239",
+                              result=result)
+
+        self.assertTrue(ResultStore.is_store(file_path=f"{self.directory.name}/output.sqlite"))
+        self.assertEqual([[1, "5025239", result, 1.0], [2, "5025240", None, 0.5]], self.store.get("F0001"))
+        self.assertIsNone(self.store.get("F0002"))
+
+
+class TestTropy(unittest.TestCase):
+    """ Test Tropy class. """
+
+    def setUp(self) -> None:
+        self.tropy = Tropy(json_export=Utility.load_json(file_path=f"{DIR}/input/export.json"))
+
+    def test_get_items(self) -> None:
+        """ Test Tropy.get_items and Tropy.get_types. """
+
+        self.assertEqual({"Foto"}, self.tropy.get_types())
+        self.assertEqual(self.tropy.graph, self.tropy.get_items(item_type="Foto", item_tag="atr_processed"))
+        self.assertEqual([self.tropy.graph[1]], self.tropy.get_items(identifier="F0002"))
+        self.assertEqual([], self.tropy.get_items(item_type="Foto", item_tag="missing"))
+
+
+class TestUtility(unittest.TestCase):
+    """ Test Utility class. """
+
+    def setUp(self) -> None:
+        self.export = f"{DIR}/input/export.json"
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_save_json_graph(self) -> None:
+        """ Test Utility.iter_json_graph and Utility.save_json_graph against Utility.save_json. """
+
+        Utility.save_json(data=Utility.load_json(file_path=self.export),
+                          file_path=f"{self.directory.name}/output.json")
+        members = dict()
+        Utility.save_json_graph(members=members,
+                                graph=Utility.iter_json_graph(file_path=self.export,
+                                                              members=members,
+                                                              chunk_size=64),
+                                file_path=f"{self.directory.name}/output_streamed.json")
+
+        with open(f"{self.directory.name}/output.json", mode="r", encoding="utf-8") as file:
+            output = file.read()
+        with open(f"{self.directory.name}/output_streamed.json", mode="r", encoding="utf-8") as file:
+            output_streamed = file.read()
+
+        self.assertEqual(output, output_streamed)
+
+    def test_save_json_compact(self) -> None:
+        """ Test compact output of Utility.save_json and Utility.save_json_graph. """
+
+        export = Utility.load_json(file_path=self.export)
+        Utility.save_json(data=export,
+                          file_path=f"{self.directory.name}/output.json",
+                          compact=True)
+        members = dict()
+        Utility.save_json_graph(members=members,
+                                graph=Utility.iter_json_graph(file_path=self.export,
+                                                              members=members),
+                                file_path=f"{self.directory.name}/output_streamed.json",
+                                compact=True)
+
+        self.assertEqual(export, Utility.load_json(file_path=f"{self.directory.name}/output.json"))
+        with open(f"{self.directory.name}/output.json", mode="r", encoding="utf-8") as file:
+            output = file.read()
+        with open(f"{self.directory.name}/output_streamed.json", mode="r", encoding="utf-8") as file:
+            output_streamed = file.read()
+
+        self.assertEqual(output, output_streamed)
+
 
 if __name__ == '__main__':
     unittest.main()